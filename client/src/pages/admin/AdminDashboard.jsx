@@ -20,14 +20,14 @@ const AdminDashboard = () => {
     try {
       const [statsRes, trendsRes, absenceRes, sessionsRes] = await Promise.all([
         axios.get(API_ENDPOINTS.ADMIN_STATS),
-        axios.get(`${API_ENDPOINTS.ADMIN_DAILY_ATTENDANCE}?days=30`),
-        axios.get(API_ENDPOINTS.ADMIN_ABSENCE_REPORT),
+        axios.get(`${API_ENDPOINTS.ADMIN_DAILY_ATTENDANCE}?days=30&tz=${encodeURIComponent(Intl.DateTimeFormat().resolvedOptions().timeZone)}`),
+        axios.get(`${API_ENDPOINTS.ADMIN_ABSENCE_REPORT}?limit=10`),
         axios.get(API_ENDPOINTS.ADMIN_SESSION_SUMMARY),
       ]);
 
       setStats(statsRes.data);
       setDailyTrends(trendsRes.data);
-      setAbsenceReport(absenceRes.data.slice(0, 10)); // Top 10
+      setAbsenceReport(absenceRes.data); // Top 10, worst attendance first
       setSessionSummary(sessionsRes.data.slice(0, 5)); // Latest 5
     } catch (error) {
       toast.error('Failed to fetch dashboard data');
@@ -25,9 +25,21 @@ const LiveAttendance = () => {
     ws.onmessage = (evt) => {
       try {
         const msg = JSON.parse(evt.data);
-        if (msg.event === "attendance_scanned") {
-          // Optimistically refetch stats for accuracy
-          fetchLive(sid);
+        if (msg.event === "ping") {
+          // Server heartbeat; unanswered pings get the socket closed
+          ws.send(JSON.stringify({ event: "pong" }));
+          return;
+        }
+        // attendance_batch carries several scans when the server coalesces bursts
+        if (msg.event === "attendance_scanned" || msg.event === "attendance_batch") {
+          const scans = msg.event === "attendance_batch" ? msg.data.scans : [msg.data.attendance];
+          if (msg.data.stats) {
+            // Scans arrive with the session's updated counters; newest first in the table
+            setStats(msg.data.stats);
+            setRecent((prev) => [...scans.slice().reverse(), ...prev].slice(0, 10));
+          } else {
+            fetchLive(sid);
+          }
         }
       } catch (_) {}
     };
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import axios from '../../utils/axios';
 import { API_ENDPOINTS } from '../../config/api';
@@ -11,11 +11,55 @@ const SessionDetail = () => {
   const [qrCode, setQrCode] = useState(null);
   const [attendance, setAttendance] = useState([]);
   const [loading, setLoading] = useState(true);
+  const qrShownRef = useRef(false);
 
   useEffect(() => {
     fetchSessionData();
   }, [id]);
 
+  useEffect(() => {
+    qrShownRef.current = Boolean(qrCode);
+  }, [qrCode]);
+
+  // With QR rotation enabled the server replaces the code every period and
+  // announces it as `qr_rotated`; refetch it so the projected code stays valid
+  useEffect(() => {
+    let ws = null;
+    let reconnectTimer = null;
+    let closed = false;
+
+    const connect = () => {
+      ws = new WebSocket(API_ENDPOINTS.REALTIME_WS(id));
+      ws.onopen = () => {
+        // Rotations may have been missed while disconnected
+        if (qrShownRef.current) refreshQRCode();
+      };
+      ws.onmessage = (evt) => {
+        try {
+          const msg = JSON.parse(evt.data);
+          if (msg.event === 'ping') {
+            // Server heartbeat; unanswered pings get the socket closed
+            ws.send(JSON.stringify({ event: 'pong' }));
+          } else if (msg.event === 'qr_rotated') {
+            if (qrShownRef.current) refreshQRCode();
+          }
+        } catch (_) {}
+      };
+      ws.onclose = () => {
+        if (!closed) reconnectTimer = setTimeout(connect, 3000);
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(reconnectTimer);
+      if (ws) {
+        try { ws.close(); } catch (_) {}
+      }
+    };
+  }, [id]);
+
   const fetchSessionData = async () => {
     setLoading(true);
     try {
@@ -44,6 +88,15 @@ const SessionDetail = () => {
     }
   };
 
+  const refreshQRCode = async () => {
+    try {
+      const response = await axios.get(API_ENDPOINTS.SESSION_QR(id));
+      setQrCode(response.data);
+    } catch (error) {
+      // Keep showing the last code; the next rotation replaces it
+    }
+  };
+
   const deactivateSession = async () => {
     if (!window.confirm('Are you sure you want to deactivate this session?')) return;
 
@@ -0,0 +1 @@
+"""Benchmarks for Smart Attendance System hot paths"""
@@ -0,0 +1,124 @@
+"""
+Live Stats Benchmark
+Compares the legacy live-stats computation (full attendance read + N+1 user
+lookups) with the single aggregation pipeline used to seed live stats
+
+Usage (from the server directory, with MongoDB running):
+    python -m benchmarks.live_stats_aggregation --attendees 5000 --runs 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import database
+from benchmarks.scan_round_trips import CommandCounter
+from config import settings
+from models.user import UserRole
+from utils.live_stats import LiveStatsRegistry
+
+
+async def legacy_live_stats(db, session_id: str) -> dict:
+    """Reproduction of the original get_session_live_stats computation"""
+    session = await db.sessions.find_one({"_id": ObjectId(session_id)})
+    total_students = await db.users.count_documents({"role": UserRole.TRAINEE.value})
+
+    records = await db.attendance_records.find({"session_id": session_id}).to_list(length=None)
+    present = sum(1 for r in records if r.get("status") in ("present", "late"))
+    late = sum(1 for r in records if r.get("status") == "late")
+
+    recent = await db.attendance_records.find({"session_id": session_id}).sort("timestamp", -1).limit(10).to_list(length=10)
+    recent_enriched = []
+    for r in recent:
+        user = await db.users.find_one({"_id": ObjectId(r["user_id"])})
+        recent_enriched.append({"user_name": user.get("name") if user else None})
+
+    return {"title": session["title"], "present": present, "late": late, "total": total_students, "recent": recent_enriched}
+
+
+async def aggregated_live_stats(db, session_id: str) -> dict:
+    """Current seed path: one aggregation round trip"""
+    # A fresh registry so every run computes instead of hitting the cache
+    live = await LiveStatsRegistry(max_sessions=1, ttl_seconds=60, recent_size=10).get(db, session_id)
+    return live.stats()
+
+
+async def seed(db, attendees: int) -> str:
+    """Create one session with `attendees` trainees who all scanned"""
+    start = datetime.utcnow() - timedelta(hours=1)
+    session = await db.sessions.insert_one({
+        "title": "Benchmark Session",
+        "start_time": start,
+        "end_time": start + timedelta(hours=2),
+        "created_by": str(ObjectId()),
+        "active": True,
+        "created_at": datetime.utcnow()
+    })
+    session_id = str(session.inserted_id)
+
+    users = await db.users.insert_many([
+        {"name": f"Trainee {i}", "email": f"bench.trainee{i}@example.com", "role": "trainee", "created_at": datetime.utcnow()}
+        for i in range(attendees)
+    ])
+    await db.attendance_records.insert_many([
+        {
+            "session_id": session_id,
+            "user_id": str(user_id),
+            "status": "late" if i % 4 == 0 else "present",
+            "method": "qr_code",
+            "timestamp": start + timedelta(seconds=i)
+        }
+        for i, user_id in enumerate(users.inserted_ids)
+    ])
+    return session_id
+
+
+async def run_path(name, compute, db, counter, session_id, runs):
+    await compute(db, session_id)  # Warm up
+
+    latencies = []
+    counter.clear()
+    counter.enabled = True
+    for _ in range(runs):
+        started = time.perf_counter()
+        await compute(db, session_id)
+        latencies.append((time.perf_counter() - started) * 1000)
+    counter.enabled = False
+
+    latencies.sort()
+    print(f"\n📊 {name}")
+    print(f"   round trips per call: {counter.total() / runs:.1f}  {dict(counter.commands)}")
+    print(f"   mean latency:         {statistics.mean(latencies):.2f} ms")
+    print(f"   p95 latency:          {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attendees", type=int, default=5000, help="Trainees who scanned into the session")
+    parser.add_argument("--runs", type=int, default=50, help="Timed computations per path")
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(settings.mongodb_url, event_listeners=[counter])
+    db = client[f"{settings.database_name}_bench"]
+    await client.drop_database(db.name)
+
+    # Reuse the application's index definitions
+    database.database = db
+    await database.create_indexes()
+
+    session_id = await seed(db, args.attendees)
+    await run_path("Legacy live stats", legacy_live_stats, db, counter, session_id, args.runs)
+    await run_path("Aggregated live stats", aggregated_live_stats, db, counter, session_id, args.runs)
+
+    await client.drop_database(db.name)
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
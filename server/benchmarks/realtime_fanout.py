@@ -0,0 +1,105 @@
+"""
+Realtime Fan-out Benchmark
+Measures the cost of broadcasting one attendance event to N websocket subscribers
+
+Compares the previous path, where every socket serialized the event itself
+(`send_json` -> json.dumps per subscriber), with the current encode-once path
+of RealtimeManager. Sockets are in-memory stand-ins, so no server or
+database is needed.
+
+Usage (from the server directory):
+    python -m benchmarks.realtime_fanout --subscribers 1 10 50 200 --events 2000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from bson import ObjectId
+
+from utils.pubsub import LocalPubSub
+from utils.realtime import RealtimeManager, _json_default
+
+
+class NullWebSocket:
+    """Websocket stand-in that discards frames"""
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        pass
+
+    async def send_json(self, data):
+        # What starlette does for send_json, with datetimes made serializable
+        await self.send_text(json.dumps(data, default=_json_default, separators=(",", ":")))
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+def sample_payload() -> dict:
+    return {
+        "attendance": {
+            "id": str(ObjectId()),
+            "session_id": str(ObjectId()),
+            "user_id": str(ObjectId()),
+            "status": "present",
+            "method": "qr_code",
+            "timestamp": datetime.utcnow(),
+        }
+    }
+
+
+async def per_socket_encode(subscribers: int, events: int) -> float:
+    """Previous path: send_json on every socket in turn"""
+    sockets = [NullWebSocket() for _ in range(subscribers)]
+    payload = sample_payload()
+    started = time.perf_counter()
+    for _ in range(events):
+        for ws in sockets:
+            await ws.send_json({"event": "attendance_scanned", "data": payload})
+    return time.perf_counter() - started
+
+
+async def encode_once(subscribers: int, events: int) -> float:
+    """Current path: broadcast through RealtimeManager and drain the writer tasks"""
+    manager = RealtimeManager(LocalPubSub(), queue_size=events, slow_consumer_policy="drop_oldest")
+    await manager.start()
+    for _ in range(subscribers):
+        ws = NullWebSocket()
+        await manager.connect(ws)
+        manager.subscribe(ws, "bench")
+    payload = sample_payload()
+
+    started = time.perf_counter()
+    for _ in range(events):
+        await manager.broadcast("bench", "attendance_scanned", payload)
+    while manager.sent < subscribers * events:
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    await manager.stop()
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--events", type=int, default=2000, help="Events broadcast per run")
+    args = parser.parse_args()
+
+    print(f"\n📊 Fan-out cost per event ({args.events} events)")
+    print(f"   {'subscribers':>11}  {'per-socket encode':>18}  {'encode once':>12}")
+    for subscribers in args.subscribers:
+        legacy = await per_socket_encode(subscribers, args.events)
+        current = await encode_once(subscribers, args.events)
+        print(
+            f"   {subscribers:>11}  {legacy / args.events * 1e6:>15.1f} µs"
+            f"  {current / args.events * 1e6:>9.1f} µs"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
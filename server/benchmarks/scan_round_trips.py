@@ -0,0 +1,191 @@
+"""
+Scan Path Round-Trip Benchmark
+Counts MongoDB commands issued per QR scan for the legacy and current scan paths
+
+Usage (from the server directory, with MongoDB running):
+    python -m benchmarks.scan_round_trips --scans 200
+"""
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+import database
+from config import settings
+from models.attendance import AttendanceCreate, AttendanceInDB, AttendanceStatus, AttendanceMethod
+from models.user import TokenData
+from routes.attendance import drain_side_effects, mark_attendance_qr
+from utils.qr_generator import generate_qr_code_value, get_qr_expiry_time, is_qr_expired
+
+# Driver housekeeping that is not part of the scan itself
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "killCursors"}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """
+    Counts commands sent to the server while enabled, separately for the
+    response path and for background side effects (while `in_background`)
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.in_background = False
+        self.commands = Counter()
+        self.collections = Counter()
+        self.background = Counter()
+
+    def started(self, event):
+        if self.enabled and event.command_name not in IGNORED_COMMANDS:
+            if self.in_background:
+                self.background[event.command_name] += 1
+                return
+            self.commands[event.command_name] += 1
+            collection = event.command.get(event.command_name)
+            if isinstance(collection, str):
+                self.collections[collection] += 1
+
+    def clear(self):
+        self.commands.clear()
+        self.collections.clear()
+        self.background.clear()
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def total(self) -> int:
+        return sum(self.commands.values())
+
+
+async def legacy_scan(db, code_value: str, email: str, _user_id: str):
+    """Reproduction of the original read-then-insert scan path (resolves the user by email)"""
+    qr_code = await db.qr_codes.find_one({"code_value": code_value})
+    if not qr_code or is_qr_expired(qr_code["expires_at"]):
+        raise HTTPException(status_code=400, detail="Invalid QR code")
+
+    session_id = qr_code["session_id"]
+    try:
+        session = await db.sessions.find_one({"_id": ObjectId(session_id)})
+    except Exception:
+        session = await db.sessions.find_one({"_id": session_id})
+
+    user = await db.users.find_one({"email": email})
+    user_id = str(user["_id"])
+
+    existing = await db.attendance_records.find_one({"session_id": session_id, "user_id": user_id})
+    if existing:
+        raise HTTPException(status_code=400, detail="Attendance already marked for this session")
+
+    status = AttendanceStatus.LATE if datetime.utcnow() > session["start_time"] else AttendanceStatus.PRESENT
+    record = AttendanceInDB(session_id=session_id, user_id=user_id, status=status, method=AttendanceMethod.QR_CODE)
+    result = await db.attendance_records.insert_one(record.model_dump())
+    return await db.attendance_records.find_one({"_id": result.inserted_id})
+
+
+async def current_scan(db, code_value: str, email: str, user_id: str):
+    """Current scan path, called the same way the router would with a current token"""
+    return await mark_attendance_qr(
+        AttendanceCreate(qr_code_value=code_value),
+        current_user=TokenData(email=email, role="trainee", user_id=user_id, name=email, org="Benchmark"),
+        db=db
+    )
+
+
+async def seed(db, scans: int):
+    """Create one session, one QR code and `scans` trainees"""
+    session = await db.sessions.insert_one({
+        "title": "Benchmark Session",
+        "start_time": datetime.utcnow() + timedelta(hours=1),
+        "end_time": datetime.utcnow() + timedelta(hours=2),
+        "created_by": str(ObjectId()),
+        "active": True,
+        "created_at": datetime.utcnow()
+    })
+    session_id = str(session.inserted_id)
+    code_value = generate_qr_code_value(session_id)
+    await db.qr_codes.insert_one({
+        "session_id": session_id,
+        "code_value": code_value,
+        "expires_at": get_qr_expiry_time(),
+        "created_at": datetime.utcnow()
+    })
+    emails = [f"bench.trainee{i}@example.com" for i in range(scans)]
+    result = await db.users.insert_many([
+        {"name": f"Trainee {i}", "email": email, "role": "trainee", "created_at": datetime.utcnow()}
+        for i, email in enumerate(emails)
+    ])
+    return code_value, list(zip(emails, map(str, result.inserted_ids)))
+
+
+async def run_path(name, scan, db, counter, code_value, users):
+    """Run one scan per trainee, then one duplicate scan, and report the command counts"""
+    await db.attendance_records.delete_many({})
+
+    counter.clear()
+    counter.enabled = True
+    elapsed = 0.0
+    for email, user_id in users:
+        started = time.perf_counter()
+        await scan(db, code_value, email, user_id)
+        elapsed += time.perf_counter() - started
+        # Side effects only start once the scan returned; count them apart
+        counter.in_background = True
+        await drain_side_effects()
+        counter.in_background = False
+    counter.enabled = False
+    per_scan = counter.total() / len(users)
+    background = sum(counter.background.values())
+    breakdown = dict(counter.commands)
+
+    counter.clear()
+    counter.enabled = True
+    try:
+        await scan(db, code_value, *users[0])
+    except HTTPException:
+        pass
+    counter.in_background = True
+    await drain_side_effects()
+    counter.in_background = False
+    counter.enabled = False
+    duplicate = counter.total()
+
+    print(f"\n📊 {name}")
+    print(f"   round trips per scan:        {per_scan:.2f}  {breakdown}")
+    print(f"   background commands per scan: {background / len(users):.2f}  {dict(counter.background)}")
+    print(f"   round trips per duplicate:   {duplicate}")
+    print(f"   mean latency per scan:       {elapsed / len(users) * 1000:.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=200, help="Number of distinct trainees scanning")
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(settings.mongodb_url, event_listeners=[counter])
+    db = client[f"{settings.database_name}_bench"]
+    await client.drop_database(db.name)
+
+    # Reuse the application's index definitions, including the unique (session_id, user_id) index
+    database.database = db
+    await database.create_indexes()
+
+    code_value, users = await seed(db, args.scans)
+    await run_path("Legacy scan path", legacy_scan, db, counter, code_value, users)
+    await run_path("Current scan path", current_scan, db, counter, code_value, users)
+
+    await client.drop_database(db.name)
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
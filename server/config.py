@@ -23,8 +23,63 @@ class Settings(BaseSettings):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 1440
     
+    # Password Hashing Configuration
+    bcrypt_rounds: int = 12  # Existing hashes are migrated to this cost on login
+    password_hash_workers: int = 4  # Threads dedicated to bcrypt
+    password_hash_max_pending: int = 64  # Running + queued hashes before returning 503
+    
     # QR Code Configuration
     qr_code_expiry_minutes: int = 15
+    qr_token_mode: str = "random"  # "random" (stored in qr_codes) or "signed" (stateless HMAC)
+    qr_signing_key: str = ""  # Falls back to secret_key when empty
+    qr_cache_ttl_seconds: int = 30  # Upper bound on how long a resolved QR code is cached
+    qr_cache_max_entries: int = 1024
+    qr_image_cache_max_entries: int = 512  # Rendered QR images kept per worker
+    qr_image_cache_max_bytes: int = 8 * 1024 * 1024
+    qr_render_processes: int = 2  # Worker processes for QR rendering (0 renders in-process)
+    qr_code_retention_hours: int = 24  # Expired qr_codes documents are deleted after this long
+    qr_rotation_enabled: bool = False  # Rotate QR codes of live sessions for anti-sharing
+    qr_rotation_seconds: int = 60
+    qr_rotation_grace_seconds: int = 15  # The previous code keeps working this long
+    qr_rotation_lead_seconds: int = 5  # Issue and render the next code this early
+    
+    # Attendance Ingest Configuration
+    attendance_batch_enabled: bool = False  # Batch scan inserts with insert_many
+    attendance_batch_size: int = 100  # Flush when this many scans are waiting
+    attendance_batch_interval_ms: int = 20  # ...or this long after the first one arrived
+    attendance_batch_max_queue: int = 2000  # Scans buffered before callers get 503
+    
+    # Scan Journal Configuration
+    scan_journal_enabled: bool = False  # Journal scans locally when MongoDB is slow
+    scan_journal_dir: str = "journal"
+    scan_journal_write_budget_ms: int = 500  # Journal the scan if the insert takes longer
+    scan_journal_replay_interval_seconds: float = 5
+    
+    # Realtime Configuration
+    realtime_backend: str = "local"  # "local" (single worker) or "mongo" (fan-out across workers)
+    realtime_events_collection_bytes: int = 16 * 1024 * 1024  # Size of the capped event collection
+    realtime_send_queue_size: int = 100  # Outbound events buffered per websocket
+    realtime_slow_consumer_policy: str = "drop_oldest"  # "drop_oldest" or "disconnect" when a queue is full
+    realtime_coalesce_window_ms: int = 0  # Batch attendance_scanned events per session (0 = off)
+    realtime_ping_interval_seconds: float = 20  # Server ping frequency (0 = no heartbeat)
+    realtime_pong_timeout_seconds: float = 10  # Close sockets silent for interval + timeout
+    realtime_max_connections: int = 5000  # Websockets per worker (0 = unlimited)
+    realtime_max_connections_per_session: int = 500  # Websockets per session per worker (0 = unlimited)
+    realtime_max_subscriptions_per_connection: int = 100  # Sessions one websocket may subscribe to
+    realtime_firehose_max_sample_rate: float = 1.0  # Upper bound on the sample rate of "*" subscriptions
+    realtime_replay_size: int = 256  # Events kept per session for SSE resume (Last-Event-ID)
+    realtime_replay_max_sessions: int = 256
+    realtime_sse_keepalive_seconds: float = 15
+    
+    # Live Stats Configuration
+    live_stats_ttl_seconds: int = 300  # Re-seed a session's live stats from MongoDB after this long
+    live_stats_max_sessions: int = 256
+    live_stats_recent_size: int = 10  # Recent scans kept per session
+    
+    # Response Cache Configuration (polled dashboard endpoints)
+    response_cache_ttl_seconds: float = 2
+    response_cache_max_entries: int = 1024
+    admin_stats_snapshot_seconds: float = 0  # Serve /api/admin/stats from a snapshot refreshed this often (0 = off)
     
     # CORS Configuration
     cors_origins: str = "http://localhost:5173,http://localhost:3000"
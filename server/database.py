@@ -3,6 +3,7 @@ Database connection and initialization module
 Handles MongoDB connection using Motor async driver
 """
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
 from config import settings
 
 # Global database client
@@ -51,20 +52,35 @@ async def create_indexes():
     await database.users.create_index("email", unique=True)
     await database.users.create_index("role")
     await database.users.create_index("organization_type")
+    await database.users.create_index("created_at")
     
     # Sessions collection indexes
     await database.sessions.create_index("created_by")
     await database.sessions.create_index("start_time")
     await database.sessions.create_index("active")
+    await database.sessions.create_index("created_at")
+    await database.sessions.create_index([("active", 1), ("start_time", -1), ("_id", -1)])
     
     # Attendance records indexes
     await database.attendance_records.create_index([("session_id", 1), ("user_id", 1)], unique=True)
     await database.attendance_records.create_index("user_id")
     await database.attendance_records.create_index("timestamp")
     
+    # Trainee attendance counters in absence report order
+    await database.counters.create_index(
+        [("trainee", 1), ("attended", 1), ("_id", 1)],
+        partialFilterExpression={"trainee": True}
+    )
+    
+    # Attendance rollups; the unique key is also what backfill merges on
+    await database.daily_attendance_rollups.create_index(
+        [("hour", 1), ("organization", 1), ("status", 1), ("method", 1)],
+        unique=True
+    )
+    
     # QR codes indexes
     await database.qr_codes.create_index("session_id")
-    await database.qr_codes.create_index("expires_at")
+    await create_qr_codes_ttl_index()
     await database.qr_codes.create_index("code_value", unique=True)
     
     # Miss requests indexes
@@ -80,3 +96,17 @@ def get_database():
     Dependency to get database instance
     """
     return database
+
+
+async def create_qr_codes_ttl_index():
+    """
+    Expire `qr_codes` documents once their code has been expired for the
+    retention period (rotation adds one per live session every period)
+    """
+    retention = settings.qr_code_retention_hours * 3600
+    try:
+        await database.qr_codes.create_index("expires_at", expireAfterSeconds=retention)
+    except OperationFailure:
+        # Replace the plain (or differently configured) index of older deployments
+        await database.qr_codes.drop_index("expires_at_1")
+        await database.qr_codes.create_index("expires_at", expireAfterSeconds=retention)
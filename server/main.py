@@ -6,7 +6,19 @@ from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from config import settings
-from database import connect_to_mongo, close_mongo_connection
+from database import connect_to_mongo, close_mongo_connection, get_database
+from utils.auth import password_hashing_pool
+from utils.counters import counter_store
+from utils.ingest import attendance_batch_writer
+from utils.event_log import session_event_log
+from utils.journal import scan_journal
+from utils.live_stats import live_session_stats
+from utils.pagination import NEXT_CURSOR_HEADER
+from utils.qr_generator import shutdown_render_pool
+from utils.qr_rotation import qr_rotator
+from utils.realtime import realtime_manager
+from utils.rollups import attendance_rollups
+from utils.system_stats import stats_snapshotter
 from routes import auth, sessions, attendance, miss_requests, admin, realtime
 
 
@@ -19,9 +31,30 @@ async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Starting Smart Attendance System...")
     await connect_to_mongo()
+    await counter_store.ensure_initialized(get_database())
+    await attendance_rollups.ensure_initialized(get_database())
+    realtime_manager.add_listener(live_session_stats.apply_event)
+    realtime_manager.add_listener(session_event_log.record)
+    await realtime_manager.start()
+    if settings.attendance_batch_enabled:
+        attendance_batch_writer.start()
+    if settings.scan_journal_enabled:
+        scan_journal.start(on_replayed=attendance.attendance_recorded)
+    if settings.qr_rotation_enabled:
+        qr_rotator.start()
+    if stats_snapshotter.enabled:
+        stats_snapshotter.start()
     yield
     # Shutdown
     print("🛑 Shutting down...")
+    await stats_snapshotter.stop()
+    await qr_rotator.stop()
+    await realtime_manager.stop()
+    await scan_journal.stop()
+    shutdown_render_pool()
+    await attendance_batch_writer.stop()
+    await attendance.drain_side_effects()
+    password_hashing_pool.shutdown()
     await close_mongo_connection()
 
 
@@ -40,6 +73,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Include routers
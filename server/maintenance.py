@@ -0,0 +1,72 @@
+"""
+Maintenance commands
+Offline jobs run against the configured database, e.g. from cron
+
+Usage (from the server directory):
+    python maintenance.py reconcile-counters [--dry-run]
+    python maintenance.py backfill-rollups [--days N]
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from database import close_mongo_connection, connect_to_mongo, get_database
+from utils.counters import counter_store
+from utils.rollups import attendance_rollups
+
+
+async def reconcile_counters(args: argparse.Namespace) -> int:
+    """Rebuild the dashboard counters and print any drift"""
+    report = await counter_store.reconcile(get_database(), repair=not args.dry_run)
+
+    print(f"🔢 Checked {report['checked']} counters in {report['duration_ms']} ms")
+    for drift in report["drift"]:
+        print(f"   {drift['key']}: expected {drift['expected']}, found {drift['actual']}")
+    if report["drifted"] > len(report["drift"]):
+        print(f"   ... and {report['drifted'] - len(report['drift'])} more")
+
+    if not report["drifted"]:
+        print("✅ No drift")
+    elif args.dry_run:
+        print(f"⚠️  {report['drifted']} counters drifted (dry run, nothing repaired)")
+    else:
+        print(f"✅ Repaired {report['drifted']} drifted counters")
+    # Non-zero exit on drift so scheduled dry runs can alert
+    return 1 if report["drifted"] and args.dry_run else 0
+
+
+async def backfill_rollups(args: argparse.Namespace) -> int:
+    """Rebuild the hourly attendance rollups from attendance_records"""
+    since = datetime.utcnow() - timedelta(days=args.days) if args.days else None
+    report = await attendance_rollups.backfill(get_database(), since=since)
+    scope = f"since {report['since']:%Y-%m-%d %H:00} UTC" if since else "all time"
+    print(f"✅ Backfilled {report['rows']} rollup rows ({scope}) in {report['duration_ms']} ms")
+    return 0
+
+
+COMMANDS = {
+    "reconcile-counters": reconcile_counters,
+    "backfill-rollups": backfill_rollups,
+}
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    reconcile = subcommands.add_parser("reconcile-counters", help="Rebuild counters from the raw collections")
+    reconcile.add_argument("--dry-run", action="store_true", help="Only report drift")
+
+    backfill = subcommands.add_parser("backfill-rollups", help="Rebuild attendance rollups from attendance_records")
+    backfill.add_argument("--days", type=int, default=None, help="Only rebuild the last N days (default: all)")
+
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        return await COMMANDS[args.command](args)
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main()))
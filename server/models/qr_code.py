@@ -4,6 +4,13 @@ Defines QR code data structures
 """
 from datetime import datetime
 from pydantic import BaseModel, Field
+from enum import Enum
+
+
+class QRImageFormat(str, Enum):
+    """Formats served by the binary QR image endpoint"""
+    PNG = "png"
+    SVG = "svg"
 
 
 class QRCodeBase(BaseModel):
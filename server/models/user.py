@@ -80,3 +80,6 @@ class TokenData(BaseModel):
     """Data stored in JWT token"""
     email: Optional[str] = None
     role: Optional[str] = None
+    user_id: Optional[str] = None  # Missing from tokens issued before the `uid` claim
+    name: Optional[str] = None  # Missing from tokens issued before the `name` claim
+    org: Optional[str] = None  # Organization name; missing from tokens issued before the `org` claim
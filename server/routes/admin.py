@@ -3,12 +3,25 @@ Admin routes
 Handles admin-specific operations like stats, analytics, and user management
 """
 from fastapi import APIRouter, HTTPException, status, Depends, Response
-from typing import List, Dict, Any
-from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from bson import ObjectId
 from database import get_database
 from models.user import TokenData, UserRole, UserResponse
-from utils.auth import require_role
+from utils.auth import get_current_user_id, password_hashing_pool, require_role
+from utils.cache import admin_stats_response_cache, qr_session_cache, response_caches
+from utils.counters import SESSIONS_KEY, counter_store
+from utils.event_log import session_event_log
+from utils.ingest import attendance_batch_writer
+from utils.journal import scan_journal
+from utils.live_stats import live_session_stats
+from utils.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, keyset_after, page_size
+from utils.qr_generator import qr_image_cache
+from utils.qr_rotation import qr_rotator
+from utils.realtime import realtime_manager
+from utils.rollups import attendance_rollups
+from utils.system_stats import compute_system_stats, stats_snapshotter
 import io
 import pandas as pd
 
@@ -31,104 +44,126 @@ async def get_system_stats(
     - Overall attendance rate
     - Pending miss requests
     - Recent activity
-    """
-    # Count users by role
-    total_users = await db.users.count_documents({})
-    admin_count = await db.users.count_documents({"role": "admin"})
-    instructor_count = await db.users.count_documents({"role": "instructor"})
-    trainee_count = await db.users.count_documents({"role": "trainee"})
-    
-    # Count sessions
-    total_sessions = await db.sessions.count_documents({})
-    active_sessions = await db.sessions.count_documents({"active": True})
-    inactive_sessions = await db.sessions.count_documents({"active": False})
-    
-    # Count attendance records
-    total_attendance_records = await db.attendance_records.count_documents({})
-    
-    # Calculate overall attendance rate
-    if total_sessions > 0 and total_users > 0:
-        expected_attendance = total_sessions * trainee_count
-        attendance_rate = (total_attendance_records / expected_attendance * 100) if expected_attendance > 0 else 0
-    else:
-        attendance_rate = 0
-    
-    # Count pending miss requests
-    pending_requests = await db.miss_requests.count_documents({"status": "pending"})
     
-    # Get recent activity (last 7 days)
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    
-    recent_sessions = await db.sessions.count_documents({
-        "created_at": {"$gte": seven_days_ago}
-    })
+    Responses are cached for `RESPONSE_CACHE_TTL_SECONDS`. With
+    `ADMIN_STATS_SNAPSHOT_SECONDS` set, the periodically refreshed snapshot
+    is served instead, with its age under `snapshot`.
+    """
+    if stats_snapshotter.enabled:
+        return await stats_snapshotter.get(db)
     
-    recent_attendance = await db.attendance_records.count_documents({
-        "timestamp": {"$gte": seven_days_ago}
-    })
+    # Concurrent dashboard polls share one computation
+    return await admin_stats_response_cache.get_or_compute("system", lambda: compute_system_stats(db))
+
+
+@router.get("/metrics")
+async def get_runtime_metrics(
+    current_user: TokenData = Depends(require_role([UserRole.ADMIN]))
+) -> Dict[str, Any]:
+    """
+    Get in-process runtime metrics of the worker serving this request
     
-    recent_registrations = await db.users.count_documents({
-        "created_at": {"$gte": seven_days_ago}
-    })
+    Admin only endpoint.
     
+    Returns:
+    - QR resolution cache size and hit/miss counters
+    - Rendered QR image cache hit ratio, size in bytes and render time
+    - Password hashing pool concurrency and queue depth
+    - Attendance write-behind buffer depth and batch sizes
+    - Scan journal backlog and replay counters
+    - QR rotation counters
+    - Realtime subscribers and cross-worker delivery latency
+    - Live session stats cache size and seed count
+    - Server-Sent Events streams and replay counters
+    - Response cache hits, coalesced requests and invalidations per endpoint
+    - Admin stats snapshot refreshes
+    - Counter updates, failures and the last reconciliation
+    - Attendance rollup updates, organization lookups and the last backfill
+    """
     return {
-        "users": {
-            "total": total_users,
-            "admins": admin_count,
-            "instructors": instructor_count,
-            "trainees": trainee_count
-        },
-        "sessions": {
-            "total": total_sessions,
-            "active": active_sessions,
-            "inactive": inactive_sessions
-        },
-        "attendance": {
-            "total_records": total_attendance_records,
-            "overall_rate": round(attendance_rate, 2)
-        },
-        "miss_requests": {
-            "pending": pending_requests
-        },
-        "recent_activity": {
-            "new_sessions": recent_sessions,
-            "new_attendance": recent_attendance,
-            "new_users": recent_registrations
-        }
+        "qr_session_cache": qr_session_cache.stats(),
+        "qr_image_cache": qr_image_cache.stats(),
+        "password_hashing": password_hashing_pool.stats(),
+        "attendance_batch_writer": attendance_batch_writer.stats(),
+        "scan_journal": scan_journal.stats(),
+        "qr_rotator": qr_rotator.stats(),
+        "realtime": realtime_manager.stats(),
+        "live_stats": live_session_stats.stats(),
+        "event_log": session_event_log.stats(),
+        "response_caches": {cache.name: cache.stats() for cache in response_caches},
+        "stats_snapshot": stats_snapshotter.stats(),
+        "counters": counter_store.stats(),
+        "attendance_rollups": attendance_rollups.stats()
     }
 
 
+@router.post("/counters/reconcile")
+async def reconcile_counters(
+    dry_run: bool = False,
+    current_user: TokenData = Depends(require_role([UserRole.ADMIN])),
+    db=Depends(get_database)
+) -> Dict[str, Any]:
+    """
+    Rebuild the dashboard counters from the raw collections
+    
+    Admin only endpoint. Reports every counter that drifted from its
+    recomputed value and, unless **dry_run** is set, repairs it.
+    
+    - **dry_run**: Only report drift, leave the counters untouched
+    """
+    report = await counter_store.reconcile(db, repair=not dry_run)
+    if not dry_run:
+        admin_stats_response_cache.invalidate("system")
+    return report
+
+
 @router.get("/analytics/daily-attendance")
 async def get_daily_attendance_trends(
     days: int = 30,
+    tz: str = "UTC",
+    organization: Optional[str] = None,
     current_user: TokenData = Depends(require_role([UserRole.ADMIN])),
     db=Depends(get_database)
 ) -> List[Dict[str, Any]]:
     """
     Get daily attendance trends for charts
     
-    Returns attendance count per day for the last N days.
+    Returns attendance count per day for the last N days, read from the
+    hourly attendance rollups and bucketed into days of the given timezone.
     
     - **days**: Number of days to retrieve (default: 30)
+    - **tz**: IANA timezone the days are counted in (default: UTC)
+    - **organization**: Only count attendees of this organization
     """
-    start_date = datetime.utcnow() - timedelta(days=days)
+    try:
+        zone = ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unknown timezone"
+        )
+    
+    # Midnight `days` days ago in the caller's timezone, as naive UTC
+    local_start = datetime.now(zone).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    start = local_start.astimezone(timezone.utc).replace(tzinfo=None)
     
-    # Aggregate attendance by day
+    match: Dict[str, Any] = {"hour": {"$gte": start}}
+    if organization is not None:
+        match["organization"] = organization
+    
+    # Aggregate rollup rows by local day
     pipeline = [
-        {
-            "$match": {
-                "timestamp": {"$gte": start_date}
-            }
-        },
+        {"$match": match},
         {
             "$group": {
                 "_id": {
                     "$dateToString": {
                         "format": "%Y-%m-%d",
-                        "date": "$timestamp"
+                        "date": "$hour",
+                        "timezone": tz
                     }
                 },
-                "count": {"$sum": 1}
+                "count": {"$sum": "$count"}
             }
         },
         {
@@ -136,7 +171,7 @@ async def get_daily_attendance_trends(
         }
     ]
     
-    results = await db.attendance_records.aggregate(pipeline).to_list(length=None)
+    results = await db.daily_attendance_rollups.aggregate(pipeline).to_list(length=None)
     
     # Format results
     return [
@@ -150,85 +185,192 @@ async def get_daily_attendance_trends(
 
 @router.get("/analytics/absence-report")
 async def get_absence_report(
+    response: Response,
+    below: Optional[float] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: TokenData = Depends(require_role([UserRole.ADMIN])),
     db=Depends(get_database)
 ) -> List[Dict[str, Any]]:
     """
     Get absence report showing users with low attendance
     
-    Returns users sorted by attendance percentage (ascending).
+    Returns trainees sorted by attendance percentage (ascending), one page
+    at a time. When more rows follow, the `X-Next-Cursor` response header
+    holds the cursor of the next page.
+    
+    - **below**: Only trainees with an attendance percentage below this value
+    - **limit**: Maximum number of trainees to return (default: 100)
+    - **cursor**: `X-Next-Cursor` value of the previous page
     """
-    # Get all trainees
-    trainees = await db.users.find({"role": "trainee"}).to_list(length=None)
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, (int, float), str)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+    limit = page_size(limit)
     
     # Total active sessions
-    total_sessions = await db.sessions.count_documents({"active": True})
+    counters = await counter_store.get(db, [SESSIONS_KEY])
+    total_sessions = counters.get(SESSIONS_KEY, {}).get("active", 0)
     
     if total_sessions == 0:
         return []
     
-    absence_data = []
+    # Every session shares the denominator, so ordering by attended records
+    # orders by percentage. Trainee counters are read in that order from the
+    # (trainee, attended, _id) index, so a page costs the same at any depth
+    query: Dict[str, Any] = {"trainee": True}
+    if below is not None:
+        query["attended"] = {"$lt": below * total_sessions / 100}
+    if after:
+        query.update(keyset_after([("attended", 1), ("_id", 1)], after))
+    
+    rows = await db.counters.find(query, {"attended": 1}).sort(
+        [("attended", 1), ("_id", 1)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1]["attended"], rows[-1]["_id"])
+    
+    # Names and emails of this page only
+    user_ids = [ObjectId(row["_id"].split(":", 1)[1]) for row in rows]
+    users = {
+        str(user["_id"]): user
+        async for user in db.users.find({"_id": {"$in": user_ids}}, {"name": 1, "email": 1})
+    }
     
-    for trainee in trainees:
-        user_id = str(trainee["_id"])
-        
-        # Count attendance
-        attendance_count = await db.attendance_records.count_documents({"user_id": user_id})
-        
-        # Calculate percentage
-        attendance_percentage = (attendance_count / total_sessions * 100) if total_sessions > 0 else 0
-        
-        absence_data.append({
+    report = []
+    for row in rows:
+        user_id = row["_id"].split(":", 1)[1]
+        user = users.get(user_id)
+        if not user:
+            # Deleted since the page was read
+            continue
+        report.append({
             "user_id": user_id,
-            "name": trainee["name"],
-            "email": trainee["email"],
-            "attended": attendance_count,
-            "missed": total_sessions - attendance_count,
+            "name": user["name"],
+            "email": user["email"],
+            "attended": row["attended"],
+            "missed": total_sessions - row["attended"],
             "total_sessions": total_sessions,
-            "attendance_percentage": round(attendance_percentage, 2)
+            "attendance_percentage": round(row["attended"] / total_sessions * 100, 2)
         })
-    
-    # Sort by attendance percentage (ascending - worst attendance first)
-    absence_data.sort(key=lambda x: x["attendance_percentage"])
-    
-    return absence_data
+    return report
 
 
 @router.get("/analytics/session-summary")
 async def get_session_summary(
+    response: Response,
+    start_from: Optional[datetime] = None,
+    start_to: Optional[datetime] = None,
+    instructor_id: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: TokenData = Depends(require_role([UserRole.ADMIN, UserRole.INSTRUCTOR])),
     db=Depends(get_database)
 ) -> List[Dict[str, Any]]:
     """
-    Get summary of all sessions with attendance counts
+    Get summary of active sessions with attendance counts
+    
+    Returns sessions with attendance statistics, latest start time first,
+    one page at a time. When more rows follow, the `X-Next-Cursor` response
+    header holds the cursor of the next page.
     
-    Returns list of sessions with attendance statistics.
+    - **start_from**: Only sessions starting at or after this time
+    - **start_to**: Only sessions starting before this time
+    - **instructor_id**: Only sessions created by this user
+    - **limit**: Maximum number of sessions to return (default: 100)
+    - **cursor**: `X-Next-Cursor` value of the previous page
     """
-    sessions = await db.sessions.find({"active": True}).sort("start_time", -1).to_list(length=None)
+    query: Dict[str, Any] = {"active": True}
+    if start_from or start_to:
+        query["start_time"] = {}
+        if start_from:
+            query["start_time"]["$gte"] = start_from
+        if start_to:
+            query["start_time"]["$lt"] = start_to
+    if instructor_id:
+        query["created_by"] = instructor_id
+    if cursor:
+        try:
+            query.update(keyset_after([("start_time", -1), ("_id", -1)], decode_cursor(cursor, datetime, ObjectId)))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+    limit = page_size(limit)
+    
+    # Joins run only for the rows of the page
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"start_time": -1, "_id": -1}},
+        {"$limit": limit + 1},
+        {
+            "$set": {
+                "counter_key": {"$concat": ["session:", {"$toString": "$_id"}]},
+                "creator_id": {
+                    "$convert": {
+                        "input": "$created_by",
+                        "to": "objectId",
+                        "onError": None,
+                        "onNull": None
+                    }
+                }
+            }
+        },
+        {
+            "$lookup": {
+                "from": "counters",
+                "localField": "counter_key",
+                "foreignField": "_id",
+                "as": "counters"
+            }
+        },
+        {
+            "$lookup": {
+                "from": "users",
+                "localField": "creator_id",
+                "foreignField": "_id",
+                "as": "creator"
+            }
+        },
+        {
+            "$project": {
+                "title": 1,
+                "description": 1,
+                "start_time": 1,
+                "end_time": 1,
+                "created_at": 1,
+                "attendance_count": {"$ifNull": [{"$arrayElemAt": ["$counters.attended", 0]}, 0]},
+                "creator_name": {"$arrayElemAt": ["$creator.name", 0]}
+            }
+        }
+    ]
     
-    summary = []
+    sessions = await db.sessions.aggregate(pipeline).to_list(length=limit + 1)
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(sessions[-1]["start_time"], sessions[-1]["_id"])
     
-    for session in sessions:
-        session_id = str(session["_id"])
-        
-        # Count attendance for this session
-        attendance_count = await db.attendance_records.count_documents({"session_id": session_id})
-        
-        # Get creator info
-        creator = await db.users.find_one({"_id": ObjectId(session["created_by"])})
-        
-        summary.append({
-            "session_id": session_id,
+    return [
+        {
+            "session_id": str(session["_id"]),
             "title": session["title"],
             "description": session.get("description", ""),
             "start_time": session["start_time"],
             "end_time": session["end_time"],
-            "created_by": creator["name"] if creator else "Unknown",
-            "attendance_count": attendance_count,
-            "created_at": session["created_at"]
-        })
-    
-    return summary
+            "created_by": session.get("creator_name") or "Unknown",
+            "attendance_count": session["attendance_count"],
+            "created_at": session.get("created_at")
+        }
+        for session in sessions
+    ]
 
 
 @router.get("/users", response_model=List[UserResponse])
@@ -292,11 +434,14 @@ async def update_user_role(
             detail="User not found"
         )
     
-    # Update role
-    await db.users.update_one(
+    # Update role; the pre-image tells the counters which role it replaced
+    previous = await db.users.find_one_and_update(
         {"_id": ObjectId(user_id)},
-        {"$set": {"role": new_role.value}}
+        {"$set": {"role": new_role.value}},
+        projection={"role": 1}
     )
+    if previous:
+        await counter_store.user_role_changed(db, user_id, previous["role"], new_role)
     
     return {
         "message": "User role updated successfully",
@@ -477,15 +622,16 @@ async def delete_user(
         )
     
     # Prevent deleting yourself
-    current_user_doc = await db.users.find_one({"email": current_user.email})
-    if str(current_user_doc["_id"]) == user_id:
+    if await get_current_user_id(current_user, db) == user_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cannot delete your own account"
         )
     
     # Delete user (hard delete for now, can be changed to soft delete)
-    await db.users.delete_one({"_id": ObjectId(user_id)})
+    deleted = await db.users.find_one_and_delete({"_id": ObjectId(user_id)}, projection={"role": 1})
+    if deleted:
+        await counter_store.user_deleted(db, user_id, deleted["role"])
     
     return {
         "message": "User deleted successfully",
@@ -3,9 +3,13 @@ Attendance management routes
 Handles QR code scanning, attendance marking, and history retrieval
 """
 from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List, Optional
+from typing import Awaitable, List, Optional, Set, Tuple
 from datetime import datetime
+import asyncio
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import DuplicateKeyError
+from config import settings
 from database import get_database
 from models.attendance import (
     AttendanceCreate, 
@@ -16,12 +20,22 @@ from models.attendance import (
     AttendanceMethod
 )
 from models.user import TokenData, UserRole
-from utils.auth import get_current_user, require_role
-from utils.qr_generator import is_qr_expired
+from utils.auth import get_current_user, get_current_user_id, require_role
+from utils.cache import qr_session_cache, seconds_until
+from utils.counters import SESSIONS_KEY, counter_store, user_key
+from utils.ingest import attendance_batch_writer
+from utils.journal import scan_journal
+from utils.live_stats import live_session_stats
+from utils.qr_generator import is_qr_expired, parse_signed_qr_value
 from utils.realtime import realtime_manager
+from utils.rollups import attendance_rollups
 
 router = APIRouter(prefix="/api/attendance", tags=["Attendance"])
 
+# Counter and rollup updates of landed records, run off the response path;
+# reconciliation and backfill repair any lost if the process dies first
+_side_effects: Set[asyncio.Task] = set()
+
 
 @router.post("/scan", response_model=AttendanceResponse, status_code=status.HTTP_201_CREATED)
 async def mark_attendance_qr(
@@ -38,12 +52,34 @@ async def mark_attendance_qr(
     
     Process:
     1. Validates QR code exists and hasn't expired
-    2. Retrieves associated session
+    2. Retrieves associated session (same round trip as the QR lookup, cached per code)
     3. Marks attendance for the user
-    4. Prevents duplicate attendance marking
+    4. Prevents duplicate attendance marking via the unique (session_id, user_id) index
+    
+    With the scan journal enabled, a scan whose insert misses the latency
+    budget is accepted into a local journal and inserted (and broadcast) later.
     """
-    # Find QR code in database
-    qr_code = await db.qr_codes.find_one({"code_value": attendance.qr_code_value})
+    # Signed QR codes are verified in memory, so forged or expired codes
+    # are rejected before any database work
+    claims = None
+    if settings.qr_token_mode == "signed":
+        claims = parse_signed_qr_value(attendance.qr_code_value)
+        if not claims:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Invalid QR code"
+            )
+        if is_qr_expired(claims[1]):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="QR code has expired"
+            )
+    
+    # Resolve QR code + session and the caller's user ID concurrently
+    qr_code, user_id = await asyncio.gather(
+        _resolve_qr_session(db, attendance.qr_code_value, claims),
+        get_current_user_id(current_user, db, verify=True)
+    )
     
     if not qr_code:
         raise HTTPException(
@@ -58,44 +94,23 @@ async def mark_attendance_qr(
             detail="QR code has expired"
         )
     
-    # Get session
     session_id = qr_code["session_id"]
-    try:
-        session = await db.sessions.find_one({"_id": ObjectId(session_id)})
-    except:
-        session = await db.sessions.find_one({"_id": session_id})
     
-    if not session or not session.get("active", False):
+    if not qr_code["active"]:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Session not found or inactive"
         )
     
-    # Get user ID
-    user = await db.users.find_one({"email": current_user.email})
-    if not user:
+    if not user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    user_id = str(user["_id"])
-    
-    # Check if attendance already marked for this session
-    existing_attendance = await db.attendance_records.find_one({
-        "session_id": session_id,
-        "user_id": user_id
-    })
-    
-    if existing_attendance:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Attendance already marked for this session"
-        )
-    
     # Determine attendance status based on timing
     current_time = datetime.utcnow()
-    session_start = session["start_time"]
+    session_start = qr_code["start_time"]
     
     # Mark as late if current time is after session start
     if current_time > session_start:
@@ -110,35 +125,218 @@ async def mark_attendance_qr(
         status=attendance_status,
         method=AttendanceMethod.QR_CODE
     )
+    created_attendance = attendance_in_db.model_dump()
+    # Assign the ObjectId client-side so the response needs no re-read
+    created_attendance["_id"] = ObjectId()
+    
+    # Insert into database; the unique (session_id, user_id) index rejects duplicates
+    inserted = await _insert_attendance(db, created_attendance)
+    if inserted is False:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Attendance already marked for this session"
+        )
     
-    # Insert into database
-    result = await db.attendance_records.insert_one(attendance_in_db.model_dump())
+    # Journaled scans are counted and broadcast by the journal replayer once they land
+    if inserted:
+        await attendance_recorded(
+            created_attendance,
+            user_name=current_user.name,
+            user_email=current_user.email,
+            organization=current_user.org
+        )
     
-    # Retrieve created attendance record
-    created_attendance = await db.attendance_records.find_one({"_id": result.inserted_id})
     created_attendance["_id"] = str(created_attendance["_id"])
+    return AttendanceResponse(**created_attendance)
+
+
+async def attendance_recorded(
+    record: dict,
+    user_name: Optional[str] = None,
+    user_email: Optional[str] = None,
+    organization: Optional[str] = None
+) -> None:
+    """
+    Side effects of a newly written attendance record, run in the
+    background: publish it to live stats and realtime subscribers, and
+    update its counters and hourly rollup
+    
+    None of them delay the response; in particular a live stats miss (first
+    scan of a session, or after the entry expired) seeds the entry from
+    attendance_records, which is far too slow for the scan path.
     
-    # Broadcast to realtime subscribers for this session
+    Called for every record that lands, whether scanned, replayed from the
+    scan journal or created by an approved miss request. Attendee details
+    not given are looked up where needed.
+    """
+    db = get_database()
+    _in_background(counter_store.attendance_recorded(db, record))
+    _in_background(attendance_rollups.record(db, record, organization))
+    _in_background(publish_attendance_scanned(record, user_name, user_email))
+
+
+def _in_background(side_effect: Awaitable[None]) -> None:
+    task = asyncio.ensure_future(side_effect)
+    _side_effects.add(task)
+    task.add_done_callback(_side_effects.discard)
+
+
+async def drain_side_effects() -> None:
+    """Wait for pending side effects of recorded attendance (on shutdown)"""
+    while _side_effects:
+        await asyncio.gather(*list(_side_effects), return_exceptions=True)
+
+
+async def publish_attendance_scanned(
+    record: dict,
+    user_name: Optional[str] = None,
+    user_email: Optional[str] = None
+) -> None:
+    """
+    Count a newly recorded attendance in the session's live stats and
+    broadcast it, with the updated stats, to realtime subscribers
+    
+    Args:
+        record: Attendance record as written to the database
+        user_name: Name of the attendee (looked up when not given)
+        user_email: Email of the attendee
+    """
     try:
+        live = await live_session_stats.record_scan(get_database(), record, user_name, user_email)
+        scan = live.recent[0] if live and live.recent and live.recent[0]["id"] == str(record["_id"]) else None
         await realtime_manager.broadcast(
-            session_id=session_id,
+            session_id=record["session_id"],
             event="attendance_scanned",
             payload={
                 "attendance": {
-                    "id": created_attendance["_id"],
-                    "session_id": created_attendance["session_id"],
-                    "user_id": created_attendance["user_id"],
-                    "status": created_attendance["status"],
-                    "method": created_attendance["method"],
-                    "timestamp": created_attendance["timestamp"],
-                }
+                    "id": str(record["_id"]),
+                    "session_id": record["session_id"],
+                    "user_id": record["user_id"],
+                    "user_name": scan["user_name"] if scan else user_name,
+                    "user_email": scan["user_email"] if scan else user_email,
+                    "status": AttendanceStatus(record["status"]).value,
+                    "method": AttendanceMethod(record["method"]).value,
+                    "timestamp": record["timestamp"],
+                },
+                "stats": live.stats() if live else None
             }
         )
     except Exception:
         # Non-fatal if broadcast fails
         pass
 
-    return AttendanceResponse(**created_attendance)
+
+async def _insert_attendance(db, record: dict) -> Optional[bool]:
+    """
+    Insert an attendance record, batching it when write-behind ingest is enabled
+    
+    With the scan journal enabled, a write that misses the latency budget is
+    accepted into the on-disk journal instead and inserted later.
+    
+    Returns:
+        Optional[bool]: True if inserted, False if the user already has a
+        record for the session, None if the scan was journaled
+    """
+    if scan_journal.running:
+        return await scan_journal.write_within_budget(_write_attendance(db, record), record)
+    return await _write_attendance(db, record)
+
+
+async def _write_attendance(db, record: dict) -> bool:
+    if attendance_batch_writer.running:
+        return await attendance_batch_writer.submit(record)
+    
+    try:
+        await db.attendance_records.insert_one(record)
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+async def _resolve_qr_session(
+    db,
+    code_value: str,
+    claims: Optional[Tuple[str, datetime]] = None
+) -> Optional[dict]:
+    """
+    Resolve a scanned QR code to its session
+    
+    Resolutions are served from `qr_session_cache` when possible; otherwise
+    the QR code and its session are fetched in a single round trip and cached
+    until the code expires (or the cache TTL, whichever comes first).
+    
+    Args:
+        db: Database instance
+        code_value: Scanned QR code value
+        claims: Verified (session_id, expires_at) of a signed QR code;
+            when given, only the session is fetched
+    
+    Returns:
+        Optional[dict]: {session_id, expires_at, start_time, active},
+        or None if the code does not exist
+    """
+    resolved = qr_session_cache.get(code_value)
+    if resolved is not None:
+        return resolved
+    
+    if claims:
+        session_id, expires_at = claims
+        try:
+            session_key = ObjectId(session_id)
+        except InvalidId:
+            session_key = session_id
+        
+        session = await db.sessions.find_one({"_id": session_key}, {"start_time": 1, "active": 1})
+    else:
+        pipeline = [
+            {"$match": {"code_value": code_value}},
+            {"$limit": 1},
+            {
+                "$lookup": {
+                    "from": "sessions",
+                    # Sessions are keyed by ObjectId, but fall back to the raw string
+                    "let": {
+                        "sid": {
+                            "$convert": {
+                                "input": "$session_id",
+                                "to": "objectId",
+                                "onError": "$session_id",
+                                "onNull": None
+                            }
+                        }
+                    },
+                    "pipeline": [
+                        {"$match": {"$expr": {"$eq": ["$_id", "$$sid"]}}},
+                        {"$project": {"start_time": 1, "active": 1}}
+                    ],
+                    "as": "session"
+                }
+            },
+            {
+                "$project": {
+                    "session_id": 1,
+                    "expires_at": 1,
+                    "session": {"$arrayElemAt": ["$session", 0]}
+                }
+            }
+        ]
+        
+        results = await db.qr_codes.aggregate(pipeline).to_list(length=1)
+        if not results:
+            return None
+        
+        session_id = results[0]["session_id"]
+        expires_at = results[0]["expires_at"]
+        session = results[0].get("session")
+    
+    resolved = {
+        "session_id": session_id,
+        "expires_at": expires_at,
+        "start_time": session["start_time"] if session else None,
+        "active": bool(session and session.get("active", False))
+    }
+    qr_session_cache.set(code_value, resolved, ttl=seconds_until(expires_at))
+    return resolved
 
 
 @router.get("/user/{user_id}", response_model=List[AttendanceResponse])
@@ -160,8 +358,7 @@ async def get_user_attendance(
     Admins and Instructors can view anyone's attendance.
     """
     # Get current user's ID
-    current_user_doc = await db.users.find_one({"email": current_user.email})
-    current_user_id = str(current_user_doc["_id"])
+    current_user_id = await get_current_user_id(current_user, db)
     
     # Permission check: users can only view their own attendance unless they're admin/instructor
     if (current_user.role not in [UserRole.ADMIN.value, UserRole.INSTRUCTOR.value] 
@@ -197,8 +394,7 @@ async def get_user_attendance_stats(
     Returns total sessions, attended, missed, late, and attendance percentage.
     """
     # Get current user's ID
-    current_user_doc = await db.users.find_one({"email": current_user.email})
-    current_user_id = str(current_user_doc["_id"])
+    current_user_id = await get_current_user_id(current_user, db)
     
     # Permission check
     if (current_user.role not in [UserRole.ADMIN.value, UserRole.INSTRUCTOR.value] 
@@ -208,16 +404,15 @@ async def get_user_attendance_stats(
             detail="You don't have permission to view this user's statistics"
         )
     
-    # Get all active sessions
-    total_sessions = await db.sessions.count_documents({"active": True})
-    
-    # Get attendance records for user
-    attendance_records = await db.attendance_records.find({"user_id": user_id}).to_list(length=None)
+    # Active sessions and the user's attendance, from the counters
+    counters = await counter_store.get(db, [SESSIONS_KEY, user_key(user_id)])
+    total_sessions = counters.get(SESSIONS_KEY, {}).get("active", 0)
+    user_counters = counters.get(user_key(user_id), {})
     
-    # Count by status
-    attended = sum(1 for r in attendance_records if r["status"] == AttendanceStatus.PRESENT.value)
-    late = sum(1 for r in attendance_records if r["status"] == AttendanceStatus.LATE.value)
-    total_attended = attended + late
+    # Counters count every record as attended and the late ones again as late
+    late = user_counters.get("late", 0)
+    total_attended = user_counters.get("attended", 0)
+    attended = total_attended - late
     missed = total_sessions - total_attended
     
     # Calculate percentage
@@ -5,8 +5,14 @@ Handles user registration, login, and profile management
 from fastapi import APIRouter, HTTPException, status, Depends
 from database import get_database
 from models.user import UserCreate, UserLogin, UserResponse, Token, UserInDB
-from utils.auth import verify_password, get_password_hash, create_access_token, get_current_user
+from utils.auth import (
+    verify_and_update_password,
+    get_password_hash_async,
+    create_access_token,
+    get_current_user
+)
 from models.user import TokenData
+from utils.counters import counter_store
 from bson import ObjectId
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
@@ -32,8 +38,8 @@ async def register_user(user: UserCreate, db=Depends(get_database)):
             detail="Email already registered"
         )
     
-    # Hash password
-    password_hash = get_password_hash(user.password)
+    # Hash password (off the event loop)
+    password_hash = await get_password_hash_async(user.password)
     
     # Create user document
     user_dict = user.model_dump(exclude={"password"})
@@ -43,6 +49,7 @@ async def register_user(user: UserCreate, db=Depends(get_database)):
     
     # Insert into database
     result = await db.users.insert_one(user_in_db.model_dump())
+    await counter_store.user_registered(db, str(result.inserted_id), user_in_db.role)
     
     # Retrieve created user
     created_user = await db.users.find_one({"_id": result.inserted_id})
@@ -71,17 +78,31 @@ async def login(credentials: UserLogin, db=Depends(get_database)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Verify password
-    if not verify_password(credentials.password, user["password_hash"]):
+    # Verify password (off the event loop)
+    password_valid, new_hash = await verify_and_update_password(credentials.password, user["password_hash"])
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Migrate hashes created with a different bcrypt cost
+    if new_hash:
+        await db.users.update_one(
+            {"_id": user["_id"]},
+            {"$set": {"password_hash": new_hash}}
+        )
+    
     # Create access token
     access_token = create_access_token(
-        data={"sub": user["email"], "role": user["role"]}
+        data={
+            "sub": user["email"],
+            "role": user["role"],
+            "uid": str(user["_id"]),
+            "name": user.get("name"),
+            "org": user.get("org_name")
+        }
     )
     
     return Token(access_token=access_token, token_type="bearer")
@@ -97,7 +118,10 @@ async def get_current_user_profile(
     
     Requires valid JWT token in Authorization header
     """
-    user = await db.users.find_one({"email": current_user.email})
+    if current_user.user_id:
+        user = await db.users.find_one({"_id": ObjectId(current_user.user_id)})
+    else:
+        user = await db.users.find_one({"email": current_user.email})
     
     if not user:
         raise HTTPException(
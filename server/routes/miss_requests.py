@@ -15,7 +15,8 @@ from models.miss_request import (
     RequestStatus
 )
 from models.user import TokenData, UserRole
-from utils.auth import get_current_user, require_role
+from routes.attendance import attendance_recorded
+from utils.auth import get_current_user, get_current_user_id, require_role
 
 router = APIRouter(prefix="/api/miss-requests", tags=["Miss Requests"])
 
@@ -52,8 +53,12 @@ async def raise_miss_request(
         )
     
     # Get user ID
-    user = await db.users.find_one({"email": current_user.email})
-    user_id = str(user["_id"])
+    user_id = await get_current_user_id(current_user, db, verify=True)
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
     
     # Check if attendance already marked for this session
     existing_attendance = await db.attendance_records.find_one({
@@ -114,8 +119,7 @@ async def list_miss_requests(
     - **limit**: Maximum number of records to return
     """
     # Get current user's ID
-    user = await db.users.find_one({"email": current_user.email})
-    user_id = str(user["_id"])
+    user_id = await get_current_user_id(current_user, db)
     
     # Build query
     query = {}
@@ -167,8 +171,7 @@ async def get_miss_request(
         )
     
     # Get current user's ID
-    user = await db.users.find_one({"email": current_user.email})
-    user_id = str(user["_id"])
+    user_id = await get_current_user_id(current_user, db)
     
     # Permission check
     if (current_user.role == UserRole.TRAINEE.value 
@@ -246,7 +249,9 @@ async def update_miss_request(
                 method=AttendanceMethod.ADMIN_OVERRIDE
             )
             
-            await db.attendance_records.insert_one(attendance_record.model_dump())
+            created_attendance = attendance_record.model_dump()
+            await db.attendance_records.insert_one(created_attendance)
+            await attendance_recorded(created_attendance)
     
     # Retrieve updated request
     updated_request = await db.miss_requests.find_one({"_id": ObjectId(request_id)})
@@ -268,8 +273,7 @@ async def get_user_miss_requests(
     Admins and Instructors can view anyone's requests.
     """
     # Get current user's ID
-    current_user_doc = await db.users.find_one({"email": current_user.email})
-    current_user_id = str(current_user_doc["_id"])
+    current_user_id = await get_current_user_id(current_user, db)
     
     # Permission check
     if (current_user.role == UserRole.TRAINEE.value 
@@ -1,35 +1,105 @@
 """
 Realtime routes for websocket attendance updates and live stats polling.
 """
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException, status
-from typing import Dict, Any
+from fastapi import APIRouter, Depends, Header, Request, WebSocket, WebSocketDisconnect, HTTPException, status
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, Any, Optional
 from bson import ObjectId
+import asyncio
+import json
+from config import settings
 from database import get_database
 from models.user import TokenData, UserRole
-from utils.auth import get_current_user, require_role
-from utils.realtime import realtime_manager
+from utils.auth import decode_token, get_current_user, require_role
+from utils.cache import live_stats_response_cache
+from utils.event_log import session_event_log
+from utils.live_stats import live_session_stats
+from utils.realtime import FIREHOSE, realtime_manager
 
 
 router = APIRouter(prefix="/api/realtime", tags=["Realtime"])
 
 
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, session_id: str):
+async def websocket_endpoint(websocket: WebSocket, session_id: Optional[str] = None, token: Optional[str] = None):
     """
-    WebSocket endpoint for subscribing to live attendance updates of a session.
+    WebSocket endpoint for subscribing to live attendance updates.
     Client connects: ws://<host>/api/realtime/ws?session_id=<id>
+    The server sends {"event": "ping"} periodically; clients that do not
+    answer with a frame such as {"event": "pong"} are disconnected.
+
+    One socket can follow many sessions with control messages:
+    - {"action": "subscribe", "session_ids": ["<id>", ...]}
+    - {"action": "unsubscribe", "session_ids": ["<id>", ...]}
+    - {"action": "subscribe", "session_ids": ["*"], "sample_rate": 0.2}
+      follows every session, sampled server-side (admins only; pass the
+      access token as ?token=<jwt>)
+    Events carry a top-level `session_id`.
     """
-    # Accept and register connection
-    await realtime_manager.connect(websocket, session_id)
+    user: Optional[TokenData] = None
+    if token:
+        try:
+            user = decode_token(token)
+        except HTTPException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid token")
+            return
+
+    # Accept and register connection (closed with 1013 when over capacity)
+    if not await realtime_manager.connect(websocket):
+        return
     try:
-        # Keep the connection alive; we don't expect incoming messages.
+        if session_id:
+            _apply_subscription(websocket, user, {"action": "subscribe", "session_ids": [session_id]})
         while True:
-            # Receive ping/keepalive or ignore incoming payloads
-            await websocket.receive_text()
+            # Any frame, normally {"event": "pong"}, proves the client is alive
+            text = await websocket.receive_text()
+            realtime_manager.touch(websocket)
+            try:
+                message = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(message, dict) and message.get("action"):
+                _apply_subscription(websocket, user, message)
     except WebSocketDisconnect:
-        await realtime_manager.disconnect(websocket, session_id)
+        await realtime_manager.disconnect(websocket)
     except Exception:
-        await realtime_manager.disconnect(websocket, session_id)
+        await realtime_manager.disconnect(websocket)
+
+
+def _apply_subscription(websocket: WebSocket, user: Optional[TokenData], message: Dict[str, Any]) -> None:
+    """Handle a subscribe/unsubscribe control message and acknowledge it"""
+    action = message.get("action")
+    session_ids = message.get("session_ids") or [message.get("session_id")]
+    if action not in ("subscribe", "unsubscribe") or not isinstance(session_ids, list):
+        realtime_manager.send(websocket, "error", {"detail": "Unknown control message"})
+        return
+
+    done, refused = [], []
+    for session_id in session_ids:
+        if session_id == FIREHOSE:
+            if not user or user.role != UserRole.ADMIN.value:
+                refused.append(session_id)
+                continue
+            rate = 0.0
+            if action == "subscribe":
+                try:
+                    rate = float(message.get("sample_rate", 1.0))
+                except (TypeError, ValueError):
+                    rate = 1.0
+                rate = min(rate, settings.realtime_firehose_max_sample_rate)
+            realtime_manager.subscribe_firehose(websocket, rate)
+            done.append(session_id)
+        elif not isinstance(session_id, str) or not ObjectId.is_valid(session_id):
+            refused.append(session_id)
+        elif action == "unsubscribe":
+            realtime_manager.unsubscribe(websocket, session_id)
+            done.append(session_id)
+        elif realtime_manager.subscribe(websocket, session_id):
+            done.append(session_id)
+        else:
+            refused.append(session_id)
+
+    realtime_manager.send(websocket, f"{action}d", {"session_ids": done, "refused": refused})
 
 
 @router.get("/session/{session_id}/live")
@@ -41,55 +111,82 @@ async def get_session_live_stats(
     """
     Returns live stats for a session: total students (enrolled), present, absent, late, percentage, and recent scans.
     This is a polling-friendly companion to the websocket.
+
+    Served from in-memory counters that are seeded once per session and
+    updated on every scan, so polling does not re-read attendance records.
     """
-    # Validate session exists
-    try:
-        session = await db.sessions.find_one({"_id": ObjectId(session_id)})
-    except Exception:
+    if not ObjectId.is_valid(session_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid session ID format")
+
+    async def compute() -> Dict[str, Any]:
+        live = await live_session_stats.get(db, session_id)
+        if not live:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+
+        return {
+            "session": dict(live.session),
+            "stats": live.stats(),
+            "recent_scans": live.recent_scans(),
+        }
+
+    # Concurrent pollers share one computation; scans invalidate the entry
+    return await live_stats_response_cache.get_or_compute(session_id, compute)
+
+
+@router.get("/session/{session_id}/events")
+async def stream_session_events(
+    session_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    current_user: TokenData = Depends(
+        require_role([UserRole.ADMIN, UserRole.INSTRUCTOR], allow_query_token=True)
+    )
+):
+    """
+    Server-Sent Events stream of a session's realtime events.
+    Browser EventSource cannot set headers, so the access token may be
+    passed as ?token=<jwt>; EventSource resends Last-Event-ID on reconnect.
+
+    Every event carries an ID; a client reconnecting with `Last-Event-ID`
+    first receives the events it missed from a bounded replay buffer. If
+    they are no longer available (buffer overrun, or the reconnect reached
+    a different worker or a restarted one), a `reset` event is sent and the
+    client should refetch `/session/{session_id}/live`.
+    """
+    if not ObjectId.is_valid(session_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid session ID format")
-    if not session:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
-
-    # Determine cohort size. If enrollment isn't modeled, use total users with role trainee as proxy.
-    total_students = await db.users.count_documents({"role": UserRole.TRAINEE.value})
-
-    # Compute attendance for this session
-    records = await db.attendance_records.find({"session_id": session_id}).to_list(length=None)
-    present = sum(1 for r in records if r.get("status") in ("present", "late"))
-    late = sum(1 for r in records if r.get("status") == "late")
-    absent = max(total_students - present, 0)
-    percentage = round((present / total_students * 100) if total_students else 0, 2)
-
-    # Recent scans (latest 10)
-    recent_cursor = db.attendance_records.find({"session_id": session_id}).sort("timestamp", -1).limit(10)
-    recent = await recent_cursor.to_list(length=10)
-    # Enrich with user name/email
-    recent_enriched = []
-    for r in recent:
+
+    async def stream() -> AsyncIterator[str]:
+        # Subscribe before reading the backlog so nothing falls in between
+        subscriber = session_event_log.subscribe(session_id)
         try:
-            user = await db.users.find_one({"_id": ObjectId(r["user_id"])})
-        except Exception:
-            user = None
-        recent_enriched.append({
-            "id": str(r.get("_id")),
-            "user_id": r.get("user_id"),
-            "user_name": user.get("name") if user else None,
-            "user_email": user.get("email") if user else None,
-            "status": r.get("status"),
-            "method": r.get("method"),
-            "timestamp": r.get("timestamp"),
-        })
-
-    return {
-        "session": {"id": str(session.get("_id")), "title": session.get("title"), "active": session.get("active", False)},
-        "stats": {
-            "total_students": total_students,
-            "present": present,
-            "absent": absent,
-            "late": late,
-            "percentage": percentage,
-        },
-        "recent_scans": recent_enriched,
-    }
+            backlog, reset = session_event_log.replay(session_id, last_event_id)
+            if reset:
+                yield session_event_log.format(None, "reset", {"session_id": session_id})
+            last_seq = 0
+            for entry in backlog:
+                last_seq = entry.seq
+                yield entry.frame
 
+            while not subscriber.overflowed:
+                try:
+                    entry = await asyncio.wait_for(
+                        subscriber.queue.get(),
+                        timeout=settings.realtime_sse_keepalive_seconds
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if entry.seq > last_seq:
+                    last_seq = entry.seq
+                    yield entry.frame
+        finally:
+            session_event_log.unsubscribe(session_id, subscriber)
 
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -2,16 +2,27 @@
 Session management routes
 Handles session creation, retrieval, and QR code generation
 """
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Depends, Request, Response
+from typing import List, Optional, Tuple
 from datetime import datetime
 from bson import ObjectId
+from config import settings
 from database import get_database
 from models.session import SessionCreate, SessionResponse, SessionInDB
-from models.qr_code import QRCodeDisplay, QRCodeInDB
+from models.qr_code import QRCodeDisplay, QRImageFormat
 from models.user import TokenData, UserRole
-from utils.auth import get_current_user, require_role
-from utils.qr_generator import generate_qr_code_value, create_qr_image, get_qr_expiry_time
+from utils.auth import get_current_user, get_current_user_id, require_role
+from utils.cache import invalidate_session_qr_cache
+from utils.counters import counter_store
+from utils.live_stats import live_session_stats
+from utils.qr_generator import (
+    QR_IMAGE_MEDIA_TYPES,
+    issue_session_qr_code,
+    qr_image_etag,
+    render_qr_image,
+    render_qr_image_bytes
+)
+from utils.realtime import realtime_manager
 
 router = APIRouter(prefix="/api/sessions", tags=["Sessions"])
 
@@ -39,9 +50,9 @@ async def create_session(
             detail="End time must be after start time"
         )
     
-    # Get user document to get user ID
-    user = await db.users.find_one({"email": current_user.email})
-    if not user:
+    # Get user ID from the token
+    user_id = await get_current_user_id(current_user, db, verify=True)
+    if not user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
@@ -49,7 +60,7 @@ async def create_session(
     
     # Create session document
     session_dict = session.model_dump()
-    session_dict["created_by"] = str(user["_id"])
+    session_dict["created_by"] = user_id
     session_dict["qr_code_id"] = None
     session_dict["active"] = True
     
@@ -57,6 +68,7 @@ async def create_session(
     
     # Insert into database
     result = await db.sessions.insert_one(session_in_db.model_dump())
+    await counter_store.session_created(db, active=True)
     
     # Retrieve created session
     created_session = await db.sessions.find_one({"_id": result.inserted_id})
@@ -140,6 +152,10 @@ async def get_session_qr_code(
     - **regenerate**: Force regenerate QR code (optional)
     
     Returns base64 encoded QR code image with metadata.
+    With `QR_TOKEN_MODE=signed` the code is a stateless HMAC token and
+    nothing is written to `qr_codes`. With `QR_ROTATION_ENABLED=true` the
+    code is replaced every rotation period and pushed to websocket
+    subscribers as a `qr_rotated` event.
     """
     # Get session
     try:
@@ -156,48 +172,20 @@ async def get_session_qr_code(
             detail="Session not found"
         )
     
-    # Check if session has an active QR code
-    existing_qr = None
-    if session.get("qr_code_id") and not regenerate:
-        try:
-            existing_qr = await db.qr_codes.find_one({"_id": ObjectId(session["qr_code_id"])})
-            
-            # Check if QR code is still valid
-            if existing_qr and existing_qr["expires_at"] > datetime.utcnow():
-                # Return existing QR code
-                qr_image = create_qr_image(existing_qr["code_value"])
-                
-                return QRCodeDisplay(
-                    qr_image_base64=qr_image,
-                    code_value=existing_qr["code_value"],
-                    expires_at=existing_qr["expires_at"],
-                    session_id=session_id,
-                    session_title=session["title"]
-                )
-        except:
-            pass  # If error, generate new QR code
+    qr_code = None
+    if regenerate:
+        # Scans of the replaced code must re-resolve against the database
+        invalidate_session_qr_cache(session_id)
+    else:
+        qr_code = await _get_current_qr_code(db, session)
     
     # Generate new QR code
-    qr_code_value = generate_qr_code_value(session_id)
-    expires_at = get_qr_expiry_time()
-    
-    qr_code_in_db = QRCodeInDB(
-        session_id=session_id,
-        code_value=qr_code_value,
-        expires_at=expires_at
-    )
+    if not qr_code:
+        qr_code = await issue_session_qr_code(db, session_id)
+    qr_code_value, expires_at = qr_code
     
-    # Insert QR code into database
-    result = await db.qr_codes.insert_one(qr_code_in_db.model_dump())
-    
-    # Update session with QR code ID
-    await db.sessions.update_one(
-        {"_id": ObjectId(session_id)},
-        {"$set": {"qr_code_id": str(result.inserted_id)}}
-    )
-    
-    # Generate QR code image
-    qr_image = create_qr_image(qr_code_value)
+    # Render (or reuse the cached) QR code image off the event loop
+    qr_image = await render_qr_image(qr_code_value, expires_at)
     
     return QRCodeDisplay(
         qr_image_base64=qr_image,
@@ -208,6 +196,84 @@ async def get_session_qr_code(
     )
 
 
+@router.get("/{session_id}/qr/image")
+async def get_session_qr_image(
+    session_id: str,
+    request: Request,
+    format: QRImageFormat = QRImageFormat.PNG,
+    current_user: TokenData = Depends(require_role([UserRole.ADMIN, UserRole.INSTRUCTOR])),
+    db=Depends(get_database)
+):
+    """
+    Get the session's current QR code as a raw image
+    
+    Only Admin and Instructor roles can access QR codes.
+    
+    - **session_id**: ID of the session
+    - **format**: `png` (image/png) or `svg` (image/svg+xml)
+    
+    Responses carry a strong ETag derived from the code value, so polling
+    clients that send `If-None-Match` get `304 Not Modified` until the code
+    changes.
+    """
+    try:
+        session = await db.sessions.find_one(
+            {"_id": ObjectId(session_id)},
+            {"qr_code_id": 1, "qr_code_value": 1, "qr_expires_at": 1}
+        )
+    except:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid session ID format"
+        )
+    
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Session not found"
+        )
+    
+    qr_code = await _get_current_qr_code(db, session)
+    if not qr_code:
+        qr_code = await issue_session_qr_code(db, session_id)
+    qr_code_value, expires_at = qr_code
+    
+    headers = {
+        "ETag": qr_image_etag(qr_code_value, format.value),
+        # Always revalidate; unchanged codes cost a 304
+        "Cache-Control": "private, no-cache"
+    }
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    image = await render_qr_image_bytes(qr_code_value, expires_at, format.value)
+    return Response(content=image, media_type=QR_IMAGE_MEDIA_TYPES[format.value], headers=headers)
+
+
+async def _get_current_qr_code(db, session: dict) -> Optional[Tuple[str, datetime]]:
+    """
+    Return the session's current (code_value, expires_at) if it is still valid
+    """
+    now = datetime.utcnow()
+    if session.get("qr_code_value") and session.get("qr_expires_at"):
+        if session["qr_expires_at"] > now:
+            return session["qr_code_value"], session["qr_expires_at"]
+        return None
+    
+    # Sessions whose code was issued before it was kept on the session document
+    if session.get("qr_code_id") and settings.qr_token_mode != "signed":
+        try:
+            existing_qr = await db.qr_codes.find_one({"_id": ObjectId(session["qr_code_id"])})
+        except Exception:
+            return None
+        if existing_qr and existing_qr["expires_at"] > now:
+            return existing_qr["code_value"], existing_qr["expires_at"]
+    
+    return None
+
+
 @router.patch("/{session_id}/deactivate")
 async def deactivate_session(
     session_id: str,
@@ -235,19 +301,33 @@ async def deactivate_session(
         )
     
     # Get current user's ID
-    user = await db.users.find_one({"email": current_user.email})
+    user_id = await get_current_user_id(current_user, db)
     
     # Check permission: Admin can deactivate any session, Instructor only their own
-    if current_user.role != UserRole.ADMIN.value and session["created_by"] != str(user["_id"]):
+    if current_user.role != UserRole.ADMIN.value and session["created_by"] != user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have permission to deactivate this session"
         )
     
-    # Deactivate session
-    await db.sessions.update_one(
-        {"_id": ObjectId(session_id)},
+    # Deactivate session; only the request that flips it counts it
+    result = await db.sessions.update_one(
+        {"_id": ObjectId(session_id), "active": True},
         {"$set": {"active": False}}
     )
+    if result.modified_count:
+        await counter_store.session_deactivated(db)
+    invalidate_session_qr_cache(session_id)
+    live_session_stats.update_session(session_id, active=False)
+    # Other workers drop their cached live stats when this reaches them
+    try:
+        await realtime_manager.broadcast(
+            session_id=session_id,
+            event="session_deactivated",
+            payload={"session_id": session_id}
+        )
+    except Exception:
+        # Non-fatal; their live stats expire with the TTL
+        pass
     
     return {"message": "Session deactivated successfully", "session_id": session_id}
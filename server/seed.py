@@ -10,6 +10,8 @@ from passlib.context import CryptContext
 from bson import ObjectId
 import os
 from dotenv import load_dotenv
+from utils.counters import counter_store
+from utils.rollups import attendance_rollups
 
 load_dotenv()
 
@@ -255,6 +257,12 @@ async def main():
         await create_attendance(session_ids, user_ids)
         await create_miss_requests(user_ids)
         
+        # Seeded documents bypass the write paths that maintain these
+        print("\n🔢 Rebuilding dashboard counters and attendance rollups...")
+        await counter_store.reconcile(db)
+        await attendance_rollups.backfill(db)
+        print("✅ Counters and rollups rebuilt")
+        
         print("\n" + "="*60)
         print("🎉 DATABASE SEEDING COMPLETED SUCCESSFULLY!")
         print("="*60)
@@ -0,0 +1,43 @@
+"""
+Tests for signed QR code values
+Run from the server directory: python -m pytest tests
+"""
+from datetime import datetime, timedelta
+from bson import ObjectId
+from utils.qr_generator import generate_signed_qr_value, parse_signed_qr_value
+
+
+def _signed_value():
+    session_id = str(ObjectId())
+    expires_at = (datetime.utcnow() + timedelta(minutes=5)).replace(microsecond=0)
+    return session_id, expires_at, generate_signed_qr_value(session_id, expires_at)
+
+
+def test_valid_value_round_trips():
+    session_id, expires_at, value = _signed_value()
+    assert parse_signed_qr_value(value) == (session_id, expires_at)
+
+
+def test_tampered_signature_is_rejected():
+    _, _, value = _signed_value()
+    payload, signature = value.rsplit(".", 1)
+    forged = signature[:-1] + ("A" if signature[-1] != "A" else "B")
+    assert parse_signed_qr_value(f"{payload}.{forged}") is None
+
+
+def test_tampered_payload_is_rejected():
+    _, _, value = _signed_value()
+    _, session_id, expiry, nonce, signature = value.split(".")
+    assert parse_signed_qr_value(f"v1.{session_id}.{int(expiry) + 3600}.{nonce}.{signature}") is None
+
+
+def test_non_ascii_value_is_rejected():
+    _, _, value = _signed_value()
+    payload, _ = value.rsplit(".", 1)
+    assert parse_signed_qr_value(f"{payload}.é") is None
+    assert parse_signed_qr_value("v1.é.1.nonce.sig") is None
+
+
+def test_malformed_value_is_rejected():
+    assert parse_signed_qr_value("not-a-signed-code") is None
+    assert parse_signed_qr_value("v2.a.b.c.d") is None
@@ -2,8 +2,13 @@
 Authentication utilities
 Handles password hashing, JWT token generation and verification
 """
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
@@ -12,10 +17,20 @@ from config import settings
 from models.user import TokenData, UserRole
 
 # Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes created with a different cost are reported by verify_and_update so
+# they can be migrated to `bcrypt_rounds` on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds
+)
 
 # HTTP Bearer token scheme
 security = HTTPBearer()
+# Same scheme for endpoints that also take the token as ?token=
+optional_security = HTTPBearer(auto_error=False)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -45,12 +60,101 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHashingPool:
+    """
+    Runs bcrypt on a dedicated, size-limited thread pool
+    
+    bcrypt releases the GIL, so hashing in worker threads keeps the event
+    loop responsive. At most `max_pending` operations may be running or
+    queued; further callers get a 503 instead of piling up behind the pool.
+    """
+    
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+    
+    async def run(self, func: Callable, *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent sign-ins, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - started
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "running": min(self.pending, self.workers),
+            "queued": max(self.pending - self.workers, 0),
+            "peak_pending": self.peak_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_seconds / self.completed * 1000, 2) if self.completed else 0.0
+        }
+    
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hashing_pool = PasswordHashingPool(
+    workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending
+)
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password on the hashing pool without blocking the event loop
+    
+    Args:
+        plain_password: Plain text password
+        hashed_password: Hashed password from database
+    
+    Returns:
+        Tuple[bool, Optional[str]]: Whether the password matches, and a
+        replacement hash if the stored one uses an outdated bcrypt cost
+    """
+    return await password_hashing_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """
+    Hash a password on the hashing pool without blocking the event loop
+    
+    Args:
+        password: Plain text password
+    
+    Returns:
+        str: Hashed password
+    """
+    return await password_hashing_pool.run(pwd_context.hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
     Create a JWT access token
     
     Args:
-        data: Dictionary containing token data (email, role, etc.)
+        data: Dictionary containing token data (sub=email, role, uid=user ID, name, org)
         expires_delta: Optional expiration time delta
     
     Returns:
@@ -92,11 +196,14 @@ def decode_token(token: str) -> TokenData:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         email: str = payload.get("sub")
         role: str = payload.get("role")
+        user_id: Optional[str] = payload.get("uid")
+        name: Optional[str] = payload.get("name")
+        org: Optional[str] = payload.get("org")
         
         if email is None:
             raise credentials_exception
         
-        token_data = TokenData(email=email, role=role)
+        token_data = TokenData(email=email, role=role, user_id=user_id, name=name, org=org)
         return token_data
         
     except JWTError:
@@ -117,17 +224,78 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     return decode_token(token)
 
 
-def require_role(required_roles: list[UserRole]):
+async def get_current_user_or_query_token(
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> TokenData:
+    """
+    Dependency like get_current_user that also accepts the token as `?token=`
+    
+    For clients that cannot set the Authorization header, such as the
+    browser EventSource.
+    
+    Args:
+        token: JWT passed as a query parameter
+        credentials: HTTP Bearer credentials, preferred when both are given
+    
+    Returns:
+        TokenData: Current user token data
+    """
+    if credentials:
+        return decode_token(credentials.credentials)
+    if token:
+        return decode_token(token)
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def get_current_user_id(current_user: TokenData, db, verify: bool = False) -> Optional[str]:
+    """
+    Resolve the authenticated user's ID
+    
+    Uses the token's `uid` claim; tokens issued before the claim existed
+    fall back to a lookup by email.
+    
+    Args:
+        current_user: Decoded token data
+        db: Database instance
+        verify: Also check that the `uid` user still exists (one indexed
+            read); write paths use it so a deleted user's unexpired token
+            cannot keep writing
+    
+    Returns:
+        Optional[str]: User ID, or None if the user no longer exists
+    """
+    if current_user.user_id:
+        if not verify:
+            return current_user.user_id
+        try:
+            user = await db.users.find_one({"_id": ObjectId(current_user.user_id)}, {"_id": 1})
+        except InvalidId:
+            return None
+        return current_user.user_id if user else None
+    
+    user = await db.users.find_one({"email": current_user.email}, {"_id": 1})
+    return str(user["_id"]) if user else None
+
+
+def require_role(required_roles: list[UserRole], allow_query_token: bool = False):
     """
     Dependency factory to check if user has required role
     
     Args:
         required_roles: List of allowed roles
+        allow_query_token: Also accept the token as `?token=`
     
     Returns:
         Callable: Dependency function
     """
-    async def role_checker(current_user: TokenData = Depends(get_current_user)) -> TokenData:
+    authenticate = get_current_user_or_query_token if allow_query_token else get_current_user
+    
+    async def role_checker(current_user: TokenData = Depends(authenticate)) -> TokenData:
         if current_user.role not in [role.value for role in required_roles]:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,263 @@
+"""
+In-process caching utilities
+Bounded LRU caches with per-entry expiry and hit/miss counters
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from config import settings
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire after a TTL
+
+    Entries can be stored with a shorter lifetime than the cache default.
+    Expired entries are dropped lazily when they are looked up; least
+    recently used entries are evicted once `maxsize` entries or, when a
+    `sizeof` function is given, `max_bytes` total bytes are exceeded.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        # key -> (monotonic expiry, value, size), ordered from least to most recently used
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, int]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires, value, _ = entry
+        if expires <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        # Never keep an entry longer than the cache-wide TTL
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._remove(key)
+        if ttl <= 0:
+            return
+
+        size = self._sizeof(value) if self._sizeof else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        self._entries[key] = (time.monotonic() + ttl, value, size)
+        self.bytes += size
+        while len(self._entries) > self.maxsize or (
+            self.max_bytes is not None and self.bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        self._remove(key)
+        return entry[1] if entry else None
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.bytes -= entry[2]
+
+    def discard_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Drop every entry whose value matches `predicate`; returns how many were dropped"""
+        keys = [key for key, (_, value, _) in self._entries.items() if predicate(value)]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        stats = {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+        if self.max_bytes is not None:
+            stats["bytes"] = self.bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+# Marks a cache miss, since None can be a cached value
+_MISSING = object()
+
+# Result handed to waiters when the computing caller was cancelled
+_RETRY = object()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent computations of the same key
+
+    The first caller computes and callers arriving meanwhile wait for its
+    result. Errors raised by the computation (e.g. HTTPException) reach
+    every waiter. If the computing caller is cancelled, its waiters are
+    not: the in-flight entry is dropped and they compute again, one of
+    them taking over.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def forget(self, key: Hashable) -> None:
+        """Detach the running computation; its result will not be stored"""
+        self._inflight.pop(key, None)
+
+    async def run(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        store: Optional[Callable[[Any], None]] = None
+    ) -> Any:
+        """
+        Compute `key`, or wait for the computation already running
+
+        Args:
+            key: What is being computed
+            compute: Computes the value
+            store: Called with the value unless `forget` was called meanwhile
+
+        Returns:
+            Any: The computed value
+        """
+        pending = self._inflight.get(key)
+        while pending is not None:
+            self.coalesced += 1
+            value = await asyncio.shield(pending)
+            if value is not _RETRY:
+                return value
+            pending = self._inflight.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so waiter-less failures are not reported as unhandled
+            future.exception()
+            raise
+        except BaseException:
+            future.set_result(_RETRY)
+            raise
+        else:
+            future.set_result(value)
+            if store is not None and self._inflight.get(key) is future:
+                store(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+
+class ResponseCache(TTLCache):
+    """
+    Short-lived cache of computed endpoint responses with single-flight
+
+    Concurrent requests for a key that is not cached wait on one shared
+    computation instead of each hitting MongoDB. Invalidating a key while
+    it is being computed discards that result, so a write is never
+    followed by a stale cached response.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float) -> None:
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.name = name
+        self._flights = SingleFlight()
+        self.invalidations = 0
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached response for `key`, computing it at most once at a time
+
+        Errors (e.g. HTTPException) are passed to every waiter and not cached.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        return await self._flights.run(key, compute, store=lambda value: self.set(key, value))
+
+    def invalidate(self, key: Hashable) -> None:
+        self.invalidations += 1
+        self.pop(key)
+        self._flights.forget(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "ttl_seconds": self.ttl,
+            "coalesced": self._flights.coalesced,
+            "invalidations": self.invalidations,
+            "in_flight": len(self._flights)
+        }
+
+
+def seconds_until(expires_at: datetime) -> float:
+    """Seconds from now (UTC) until a naive UTC timestamp"""
+    return (expires_at - datetime.utcnow()).total_seconds()
+
+
+# Resolved QR codes for the scan hot path:
+# code_value -> {session_id, expires_at, start_time, active}
+qr_session_cache = TTLCache(
+    maxsize=settings.qr_cache_max_entries,
+    ttl=settings.qr_cache_ttl_seconds
+)
+
+
+def invalidate_session_qr_cache(session_id: str) -> int:
+    """Drop every cached QR resolution that points at `session_id`"""
+    return qr_session_cache.discard_where(lambda entry: entry["session_id"] == session_id)
+
+
+# Computed responses of polled dashboard endpoints, by endpoint
+live_stats_response_cache = ResponseCache(
+    name="realtime_live",
+    maxsize=settings.response_cache_max_entries,
+    ttl=settings.response_cache_ttl_seconds
+)
+admin_stats_response_cache = ResponseCache(
+    name="admin_stats",
+    maxsize=1,
+    ttl=settings.response_cache_ttl_seconds
+)
+response_caches = [live_stats_response_cache, admin_stats_response_cache]
@@ -0,0 +1,249 @@
+"""
+Incrementally maintained counters
+Dashboard totals kept current with atomic `$inc` on every write, and a
+reconciliation job rebuilding them from the raw collections
+"""
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+
+# Documents of the `counters` collection:
+#   users            {admin, instructor, trainee}  users per role
+#   sessions         {active, inactive}            sessions per state
+#   attendance       {attended, late}              all attendance records
+#   user:<id>        {attended, late, trainee}     records of one user
+#   session:<id>     {attended, late}              records of one session
+# `attended` counts every record and `late` the late ones among them.
+# Every trainee has a user counter (zero until their first record) flagged
+# `trainee: true`, so the absence report can page through trainees by
+# attendance on the (trainee, attended, _id) index.
+USERS_KEY = "users"
+SESSIONS_KEY = "sessions"
+ATTENDANCE_KEY = "attendance"
+# Marker written by reconciliation; its absence (or an older version) means
+# the counters still have to be built
+RECONCILED_KEY = "reconciled"
+COUNTERS_VERSION = 2
+
+MAX_REPORTED_DRIFT = 100
+
+
+def user_key(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def session_key(session_id: str) -> str:
+    return f"session:{session_id}"
+
+
+def _value(value: Any) -> Any:
+    # Records built from models still hold enum members
+    return getattr(value, "value", value)
+
+
+def _attendance_fields(status: Any) -> Dict[str, int]:
+    return {"attended": 1, "late": 1 if _value(status) == "late" else 0}
+
+
+class CounterStore:
+    """
+    Counters of the `counters` collection
+
+    Write paths call the `*_created`/`*_recorded` helpers after their own
+    write succeeds. A failed counter update is logged and counted but never
+    fails the request; `reconcile` repairs the resulting drift.
+    """
+
+    def __init__(self) -> None:
+        self.increments = 0
+        self.failures = 0
+        self.reconciles = 0
+        self.last_reconcile: Optional[Dict[str, Any]] = None
+
+    async def increment(self, db, changes: Dict[str, Dict[str, int]]) -> None:
+        """
+        Apply `$inc` updates to several counter documents in one round trip
+
+        Args:
+            db: Database handle
+            changes: Counter key -> {field: delta}
+        """
+        await self._write(db, [
+            UpdateOne({"_id": key}, {"$inc": fields}, upsert=True)
+            for key, fields in changes.items()
+            if fields
+        ])
+
+    async def _write(self, db, operations: List[UpdateOne]) -> None:
+        if not operations:
+            return
+        try:
+            await db.counters.bulk_write(operations, ordered=False)
+            self.increments += len(operations)
+        except Exception as e:
+            self.failures += 1
+            print(f"⚠️  Counter update failed: {e}")
+
+    @staticmethod
+    def _trainee_flag(user_id: str, trainee: bool) -> UpdateOne:
+        if trainee:
+            # $inc by zero creates the fields, so the counter sorts by `attended`
+            update = {"$set": {"trainee": True}, "$inc": {"attended": 0, "late": 0}}
+        else:
+            update = {"$unset": {"trainee": ""}}
+        return UpdateOne({"_id": user_key(user_id)}, update, upsert=trainee)
+
+    async def user_registered(self, db, user_id: str, role: Any) -> None:
+        operations = [UpdateOne({"_id": USERS_KEY}, {"$inc": {_value(role): 1}}, upsert=True)]
+        if _value(role) == "trainee":
+            operations.append(self._trainee_flag(user_id, True))
+        await self._write(db, operations)
+
+    async def user_role_changed(self, db, user_id: str, old_role: Any, new_role: Any) -> None:
+        old_role, new_role = _value(old_role), _value(new_role)
+        if old_role == new_role:
+            return
+        operations = [UpdateOne({"_id": USERS_KEY}, {"$inc": {old_role: -1, new_role: 1}}, upsert=True)]
+        if "trainee" in (old_role, new_role):
+            operations.append(self._trainee_flag(user_id, new_role == "trainee"))
+        await self._write(db, operations)
+
+    async def user_deleted(self, db, user_id: str, role: Any) -> None:
+        operations = [UpdateOne({"_id": USERS_KEY}, {"$inc": {_value(role): -1}}, upsert=True)]
+        if _value(role) == "trainee":
+            operations.append(self._trainee_flag(user_id, False))
+        await self._write(db, operations)
+
+    async def session_created(self, db, active: bool = True) -> None:
+        await self.increment(db, {SESSIONS_KEY: {"active" if active else "inactive": 1}})
+
+    async def session_deactivated(self, db) -> None:
+        await self.increment(db, {SESSIONS_KEY: {"active": -1, "inactive": 1}})
+
+    async def attendance_recorded(self, db, record: dict) -> None:
+        fields = _attendance_fields(record.get("status"))
+        await self.increment(db, {
+            ATTENDANCE_KEY: fields,
+            user_key(record["user_id"]): fields,
+            session_key(record["session_id"]): fields
+        })
+
+    async def get(self, db, keys: Iterable[str]) -> Dict[str, dict]:
+        """Counter documents by key; missing counters are absent from the result"""
+        keys = list(keys)
+        documents = await db.counters.find({"_id": {"$in": keys}}).to_list(length=len(keys))
+        return {document.pop("_id"): document for document in documents}
+
+    async def initialized(self, db) -> bool:
+        marker = await db.counters.find_one({"_id": RECONCILED_KEY}, {"version": 1})
+        return marker is not None and marker.get("version", 1) >= COUNTERS_VERSION
+
+    async def compute(self, db) -> Dict[str, Dict[str, int]]:
+        """Counters recomputed from scratch out of the raw collections"""
+        expected: Dict[str, Dict[str, int]] = {
+            USERS_KEY: {"admin": 0, "instructor": 0, "trainee": 0},
+            SESSIONS_KEY: {"active": 0, "inactive": 0},
+            ATTENDANCE_KEY: {"attended": 0, "late": 0}
+        }
+
+        async for group in db.users.aggregate([{"$group": {"_id": "$role", "count": {"$sum": 1}}}]):
+            expected[USERS_KEY][group["_id"]] = group["count"]
+
+        async for group in db.sessions.aggregate([{"$group": {"_id": "$active", "count": {"$sum": 1}}}]):
+            expected[SESSIONS_KEY]["active" if group["_id"] else "inactive"] += group["count"]
+
+        late = {"$sum": {"$cond": [{"$eq": ["$status", "late"]}, 1, 0]}}
+        for field, key in (("user_id", user_key), ("session_id", session_key)):
+            async for group in db.attendance_records.aggregate([
+                {"$group": {"_id": f"${field}", "attended": {"$sum": 1}, "late": late}}
+            ], allowDiskUse=True):
+                expected[key(group["_id"])] = {"attended": group["attended"], "late": group["late"]}
+                if field == "user_id":
+                    expected[ATTENDANCE_KEY]["attended"] += group["attended"]
+                    expected[ATTENDANCE_KEY]["late"] += group["late"]
+
+        async for user in db.users.find({"role": "trainee"}, {"_id": 1}):
+            key = user_key(str(user["_id"]))
+            expected.setdefault(key, {"attended": 0, "late": 0})["trainee"] = True
+
+        return expected
+
+    async def reconcile(self, db, repair: bool = True) -> Dict[str, Any]:
+        """
+        Rebuild the counters from the raw collections and report drift
+
+        Writes racing with a run can show up as drift that is not real, so
+        run it while traffic is low (or with `repair=False` to only report).
+
+        Args:
+            db: Database handle
+            repair: Overwrite drifted counters and delete stale ones
+
+        Returns:
+            Dict[str, Any]: Counters checked, drifted counters (the first
+            MAX_REPORTED_DRIFT with expected and actual values), and timing
+        """
+        started = time.perf_counter()
+        expected = await self.compute(db)
+
+        drift: List[Dict[str, Any]] = []
+        operations = []
+        seen = set()
+        async for document in db.counters.find({"_id": {"$ne": RECONCILED_KEY}}):
+            key = document.pop("_id")
+            seen.add(key)
+            wanted = expected.get(key)
+            actual = {field: value for field, value in document.items() if value}
+            if wanted is not None and actual == {field: value for field, value in wanted.items() if value}:
+                continue
+            if wanted is None and not actual:
+                # e.g. the zero counter of a deleted trainee
+                continue
+            drift.append({"key": key, "expected": wanted, "actual": document})
+            operations.append(
+                ReplaceOne({"_id": key}, wanted) if wanted is not None else DeleteOne({"_id": key})
+            )
+
+        for key, wanted in expected.items():
+            if key not in seen and any(wanted.values()):
+                drift.append({"key": key, "expected": wanted, "actual": None})
+                operations.append(ReplaceOne({"_id": key}, wanted, upsert=True))
+
+        if repair:
+            if operations:
+                await db.counters.bulk_write(operations, ordered=False)
+            await db.counters.replace_one(
+                {"_id": RECONCILED_KEY},
+                {"at": datetime.utcnow(), "drifted": len(drift), "version": COUNTERS_VERSION},
+                upsert=True
+            )
+
+        report = {
+            "checked": len(expected),
+            "drifted": len(drift),
+            "repaired": repair,
+            "drift": drift[:MAX_REPORTED_DRIFT],
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            "reconciled_at": datetime.utcnow()
+        }
+        self.reconciles += 1
+        self.last_reconcile = {key: value for key, value in report.items() if key != "drift"}
+        return report
+
+    async def ensure_initialized(self, db) -> None:
+        """Build the counters on first start against an existing database"""
+        if not await self.initialized(db):
+            report = await self.reconcile(db)
+            print(f"🔢 Counters built ({report['checked']} counters, {report['duration_ms']} ms)")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "increments": self.increments,
+            "failures": self.failures,
+            "reconciles": self.reconciles,
+            "last_reconcile": self.last_reconcile
+        }
+
+
+counter_store = CounterStore()
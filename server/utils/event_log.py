@@ -0,0 +1,161 @@
+"""
+Per-session realtime event log
+Numbers each session's events and keeps a bounded replay buffer for the
+Server-Sent Events stream
+"""
+import asyncio
+import secrets
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from config import settings
+from utils.realtime import encode_json
+
+
+class LoggedEvent:
+    """One numbered event, pre-rendered as an SSE frame"""
+
+    __slots__ = ("seq", "frame")
+
+    def __init__(self, seq: int, frame: str) -> None:
+        self.seq = seq
+        self.frame = frame
+
+
+class EventSubscriber:
+    """Live SSE listener of one session"""
+
+    __slots__ = ("queue", "overflowed")
+
+    def __init__(self, queue_size: int) -> None:
+        self.queue: "asyncio.Queue[LoggedEvent]" = asyncio.Queue(maxsize=queue_size)
+        # Set when the listener fell too far behind; its stream ends and the
+        # client resumes from its Last-Event-ID
+        self.overflowed = False
+
+
+class _SessionLog:
+    __slots__ = ("epoch", "seq", "events", "subscribers")
+
+    def __init__(self, replay_size: int) -> None:
+        # Distinguishes this log from earlier ones of the same session (on
+        # this worker after eviction, or on another or restarted worker)
+        self.epoch = secrets.token_hex(4)
+        self.seq = 0
+        self.events: Deque[LoggedEvent] = deque(maxlen=replay_size)
+        self.subscribers: Set[EventSubscriber] = set()
+
+
+class SessionEventLog:
+    """
+    Sequence numbers and replay buffers for the events of each session
+
+    Event IDs have the form `<epoch>-<seq>`. The epoch identifies one
+    session log, since numbering is per worker and restarts whenever the
+    log is evicted and recreated. A client resuming with an ID from another
+    epoch, or one older than the replay buffer, is told to `reset` and
+    refetch the live stats instead.
+    """
+
+    def __init__(self, max_sessions: int, replay_size: int) -> None:
+        self.max_sessions = max_sessions
+        self.replay_size = replay_size
+        # session_id -> log, least recently active first
+        self._sessions: "OrderedDict[str, _SessionLog]" = OrderedDict()
+
+        self.recorded = 0
+        self.replayed = 0
+        self.resets = 0
+        self.overflows = 0
+
+    def _log(self, session_id: str) -> _SessionLog:
+        log = self._sessions.get(session_id)
+        if log is None:
+            log = self._sessions[session_id] = _SessionLog(self.replay_size)
+            # Evict the least recently active session nobody is streaming
+            if len(self._sessions) > self.max_sessions:
+                for candidate, candidate_log in self._sessions.items():
+                    if not candidate_log.subscribers and candidate != session_id:
+                        del self._sessions[candidate]
+                        break
+        self._sessions.move_to_end(session_id)
+        return log
+
+    def record(self, session_id: str, event: str, payload: Any) -> None:
+        """Realtime listener: number an event and hand it to live streams"""
+        log = self._log(session_id)
+        log.seq += 1
+        entry = LoggedEvent(log.seq, self.format(f"{log.epoch}-{log.seq}", event, payload))
+        log.events.append(entry)
+        self.recorded += 1
+
+        for subscriber in log.subscribers:
+            if subscriber.overflowed:
+                continue
+            try:
+                subscriber.queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                subscriber.overflowed = True
+                self.overflows += 1
+
+    @staticmethod
+    def format(event_id: Optional[str], event: str, payload: Any) -> str:
+        frame = f"id: {event_id}\n" if event_id else ""
+        return f"{frame}event: {event}\ndata: {encode_json(payload)}\n\n"
+
+    def subscribe(self, session_id: str) -> EventSubscriber:
+        subscriber = EventSubscriber(self.replay_size)
+        self._log(session_id).subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, session_id: str, subscriber: EventSubscriber) -> None:
+        log = self._sessions.get(session_id)
+        if log:
+            log.subscribers.discard(subscriber)
+
+    def replay(self, session_id: str, last_event_id: Optional[str]) -> Tuple[List[LoggedEvent], bool]:
+        """
+        Events a reconnecting client missed
+
+        Args:
+            session_id: Session being streamed
+            last_event_id: Value of the client's Last-Event-ID header
+
+        Returns:
+            Tuple[List[LoggedEvent], bool]: Missed events, and whether the
+            client must reset because they can no longer be replayed
+        """
+        if not last_event_id:
+            return [], False
+
+        epoch, _, seq = last_event_id.partition("-")
+        log = self._sessions.get(session_id)
+        if log is None or epoch != log.epoch or not seq.isdigit() or int(seq) > log.seq:
+            self.resets += 1
+            return [], True
+
+        last_seq = int(seq)
+        events = [entry for entry in log.events if entry.seq > last_seq]
+        # Something between last_seq and the oldest buffered event was evicted
+        oldest = events[0].seq if events else log.seq + 1
+        if oldest > last_seq + 1:
+            self.resets += 1
+            return [], True
+
+        self.replayed += len(events)
+        return events, False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "streams": sum(len(log.subscribers) for log in self._sessions.values()),
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "resets": self.resets,
+            "overflows": self.overflows
+        }
+
+
+session_event_log = SessionEventLog(
+    max_sessions=settings.realtime_replay_max_sessions,
+    replay_size=settings.realtime_replay_size
+)
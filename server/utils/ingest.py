@@ -0,0 +1,178 @@
+"""
+Write-behind batching for attendance inserts
+Buffers validated scans and flushes them with insert_many during scan bursts
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from fastapi import HTTPException, status
+from pymongo.errors import BulkWriteError, WriteError
+from config import settings
+from database import get_database
+
+# MongoDB duplicate key error code
+DUPLICATE_KEY_ERROR = 11000
+
+
+class AttendanceBatchWriter:
+    """
+    Bounded in-memory buffer in front of `attendance_records`
+
+    Each `submit` call enqueues one document and waits for the flush that
+    writes it. A flush happens when `batch_size` documents are waiting or
+    `flush_interval_ms` after the first one arrived, whichever comes first,
+    using one unordered `insert_many`. Callers get their own outcome back,
+    so duplicate scans are still reported individually.
+    """
+
+    def __init__(self, batch_size: int, flush_interval_ms: int, max_queue: int) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue = max_queue
+        self._pending: Deque[Tuple[dict, asyncio.Future]] = deque()
+        self._has_items = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.records = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still buffered, then stop the flusher"""
+        if self._task:
+            # Not cancelled: a flush in progress must resolve its callers
+            self._stopping = True
+            self._has_items.set()
+            self._batch_full.set()
+            await self._task
+            self._task = None
+
+        while self._pending:
+            await self._flush(self._take_batch())
+
+    async def submit(self, document: dict) -> bool:
+        """
+        Queue an attendance document for insertion
+
+        Args:
+            document: Attendance record to insert
+
+        Returns:
+            bool: True if inserted, False if (session_id, user_id) already exists
+
+        Raises:
+            HTTPException: 503 when the buffer is full (backpressure)
+        """
+        if len(self._pending) >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Attendance service is busy, please scan again",
+                headers={"Retry-After": "1"}
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((document, future))
+        self._has_items.set()
+        if len(self._pending) >= self.batch_size:
+            self._batch_full.set()
+
+        return await future
+
+    def _take_batch(self) -> List[Tuple[dict, asyncio.Future]]:
+        batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+        if len(self._pending) < self.batch_size:
+            self._batch_full.clear()
+        if not self._pending:
+            self._has_items.clear()
+        return batch
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            await self._has_items.wait()
+            if self._stopping:
+                break
+
+            # Give the batch up to one flush interval to fill up
+            if len(self._pending) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            await self._flush(self._take_batch())
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]) -> None:
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        write_errors: Dict[int, dict] = {}
+        try:
+            await get_database().attendance_records.insert_many(
+                [document for document, _ in batch],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.batches += 1
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        for index, (_, future) in enumerate(batch):
+            error = write_errors.get(index)
+            if error is None:
+                self.records += 1
+                result: Any = True
+            elif error.get("code") == DUPLICATE_KEY_ERROR:
+                self.duplicates += 1
+                result = False
+            else:
+                result = WriteError(error.get("errmsg"), error.get("code"), error)
+
+            # The caller may have gone away (e.g. client disconnect)
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.running,
+            "queue_depth": len(self._pending),
+            "max_queue": self.max_queue,
+            "batches": self.batches,
+            "records": self.records,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "avg_batch_size": round((self.records + self.duplicates) / self.batches, 2) if self.batches else 0.0,
+            "last_flush_ms": self.last_flush_ms
+        }
+
+
+attendance_batch_writer = AttendanceBatchWriter(
+    batch_size=settings.attendance_batch_size,
+    flush_interval_ms=settings.attendance_batch_interval_ms,
+    max_queue=settings.attendance_batch_max_queue
+)
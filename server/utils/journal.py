@@ -0,0 +1,333 @@
+"""
+Durable scan journal
+Accepts validated scans on local disk when MongoDB misses the write budget
+and replays them into attendance_records in the background
+"""
+import asyncio
+import glob
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from bson import json_util
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from config import settings
+from database import get_database
+
+# Called with each journaled record once it is known to be in the database
+ReplayCallback = Callable[[dict], Awaitable[None]]
+
+# Replay checkpoints are fsynced at least this often; a process crash loses
+# none of the progress, a power loss at most this many records
+CHECKPOINT_SYNC_RECORDS = 100
+
+
+def _pid_alive(pid: int) -> bool:
+    """Whether another local worker process is still running"""
+    if os.name != "posix":
+        # os.kill(pid, 0) would terminate the process on Windows; assume alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _owner(path: str) -> Optional[int]:
+    """PID in a segment name (`scans-<pid>...` or `...replaying-<pid>`)"""
+    owner = os.path.basename(path).rsplit("-", 1)[-1].split(".")[0]
+    return int(owner) if owner.isdigit() else None
+
+
+def _is_segment(path: str) -> bool:
+    # Excludes the .offset checkpoints and .tmp files next to segments
+    return os.path.basename(path).rsplit("-", 1)[-1].isdigit() or path.endswith((".jsonl", ".sealed"))
+
+
+class _ReplayCheckpoint:
+    """
+    Lines of a claimed segment already replayed, kept in `<segment>.offset`
+
+    Saving overwrites one fixed-width number in place, so progress costs a
+    small write per record rather than a rewrite of the segment.
+    """
+
+    def __init__(self, segment: str) -> None:
+        self.path = f"{segment}.offset"
+        self._fd: Optional[int] = None
+        self._unsynced = 0
+
+    def load(self) -> int:
+        try:
+            with open(self.path, encoding="utf-8") as checkpoint_file:
+                return int(checkpoint_file.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def save(self, position: int) -> bool:
+        """Record that the first `position` lines are done; True when a sync is due"""
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, f"{position:020d}".encode())
+        self._unsynced += 1
+        return self._unsynced >= CHECKPOINT_SYNC_RECORDS
+
+    def sync(self) -> None:
+        if self._fd is not None and self._unsynced:
+            os.fsync(self._fd)
+            self._unsynced = 0
+
+    def close(self) -> None:
+        self.sync()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def remove(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ScanJournal:
+    """
+    Append-only, fsynced journal of accepted scans
+
+    Every worker appends to its own segment (`scans-<pid>.jsonl`). The
+    replayer periodically seals the active segment, claims sealed segments
+    (including those left behind by dead workers) with an atomic rename,
+    and inserts their records. Records carry their ObjectId, so replaying
+    a segment twice is harmless; progress through a segment is kept in an
+    `.offset` checkpoint next to it, updated after every landed record, so
+    the replay callback runs once per record.
+    """
+
+    def __init__(self, directory: str, write_budget_ms: int, replay_interval_seconds: float) -> None:
+        self.directory = directory
+        self.write_budget = write_budget_ms / 1000
+        self.replay_interval = replay_interval_seconds
+        self._pid = os.getpid()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._on_replayed: Optional[ReplayCallback] = None
+
+        self.journaled = 0
+        self.replayed = 0
+        self.replay_duplicates = 0
+        self.replay_failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def _active_path(self) -> str:
+        return os.path.join(self.directory, f"scans-{self._pid}.jsonl")
+
+    def start(self, on_replayed: Optional[ReplayCallback] = None) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._on_replayed = on_replayed
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def write_within_budget(self, write: Awaitable[bool], record: dict) -> Optional[bool]:
+        """
+        Await a database write, journaling the record if it is too slow
+
+        The write keeps running in the background after the budget expires;
+        if it lands, replay sees the same ObjectId and treats it as done.
+
+        Args:
+            write: Pending insert returning True (inserted) or False (duplicate)
+            record: Attendance record being inserted, including its `_id`
+
+        Returns:
+            Optional[bool]: The write's result, or None if the scan was
+            journaled and will be inserted later
+        """
+        task = asyncio.ensure_future(write)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=self.write_budget)
+        except (asyncio.TimeoutError, ConnectionFailure):
+            # Retrieve the late outcome so it is never reported as unhandled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            await self.append(record)
+            return None
+
+    async def append(self, record: dict) -> None:
+        line = json_util.dumps(record) + "\n"
+        async with self._lock:
+            await asyncio.to_thread(self._append_sync, line)
+        self.journaled += 1
+
+    def _append_sync(self, line: str) -> None:
+        with open(self._active_path, "a", encoding="utf-8") as journal_file:
+            journal_file.write(line)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.replay()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Scan journal replay failed: {e}")
+            await asyncio.sleep(self.replay_interval)
+
+    async def replay(self) -> int:
+        """Drain every claimable segment into attendance_records; returns records replayed"""
+        async with self._lock:
+            if os.path.exists(self._active_path):
+                os.replace(self._active_path, os.path.join(
+                    self.directory, f"scans-{self._pid}-{time.time_ns()}.sealed"
+                ))
+
+        replayed = 0
+        for segment in self._claim_segments():
+            replayed += await self._replay_segment(segment)
+        return replayed
+
+    def _orphaned(self, path: str) -> bool:
+        owner = _owner(path)
+        return owner is not None and owner != self._pid and not _pid_alive(owner)
+
+    def _claim_segments(self) -> List[str]:
+        """Atomically take ownership of sealed and orphaned segments"""
+        self._remove_stale_files()
+
+        claimable = glob.glob(os.path.join(self.directory, "*.sealed"))
+        for path in glob.glob(os.path.join(self.directory, "scans-*.jsonl")) + \
+                glob.glob(os.path.join(self.directory, "*.replaying-*")):
+            if _is_segment(path) and self._orphaned(path):
+                claimable.append(path)
+
+        claimed = []
+        for path in sorted(claimable):
+            stem = os.path.basename(path).split(".")[0]
+            target = os.path.join(self.directory, f"{stem}-{time.time_ns()}.replaying-{self._pid}")
+            try:
+                os.rename(path, target)
+            except FileNotFoundError:
+                continue  # Another worker claimed it first
+            # A dead worker's progress moves with its segment
+            try:
+                os.rename(f"{path}.offset", f"{target}.offset")
+            except FileNotFoundError:
+                pass
+            claimed.append(target)
+
+        # Segments this worker claimed earlier but could not finish
+        claimed_before = glob.glob(os.path.join(self.directory, f"*.replaying-{self._pid}"))
+        return sorted(set(claimed) | set(claimed_before))
+
+    def _remove_stale_files(self) -> None:
+        """
+        Delete `.tmp` files left by crashed workers and this worker's
+        `.offset` checkpoints whose segment is gone
+
+        Neither holds records, so they are never claimed or replayed. A dead
+        worker's checkpoint is left alone: it is moved along with its
+        segment by whichever worker claims it.
+        """
+        for path in glob.glob(os.path.join(self.directory, "*.tmp")):
+            if _owner(path) == self._pid or self._orphaned(path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        for path in glob.glob(os.path.join(self.directory, f"*.replaying-{self._pid}.offset")):
+            if not os.path.exists(path[:-len(".offset")]):
+                os.remove(path)
+
+    async def _replay_segment(self, segment: str) -> int:
+        lines = await asyncio.to_thread(self._read_lines, segment)
+        checkpoint = _ReplayCheckpoint(segment)
+        start = checkpoint.load()
+
+        db = get_database()
+        replayed = 0
+        try:
+            for position, line in enumerate(lines[start:], start):
+                try:
+                    record = json_util.loads(line)
+                except ValueError:
+                    # Torn final line from a crash mid-append
+                    self.replay_failures += 1
+                    continue
+
+                try:
+                    try:
+                        await db.attendance_records.insert_one(record)
+                        landed = True
+                    except DuplicateKeyError:
+                        # Either the original write landed late (same _id) or the
+                        # user was already marked by another scan
+                        landed = await db.attendance_records.find_one({"_id": record["_id"]}, {"_id": 1}) is not None
+                except ConnectionFailure:
+                    # Database still unavailable; resume here next round
+                    return replayed
+
+                if not landed:
+                    self.replay_duplicates += 1
+                    continue
+
+                # Checkpoint before the callback: its side effects (counters,
+                # rollups) are not idempotent, so a retried segment must not
+                # see this record again
+                if checkpoint.save(position + 1):
+                    await asyncio.to_thread(checkpoint.sync)
+                self.replayed += 1
+                replayed += 1
+                if self._on_replayed:
+                    try:
+                        await self._on_replayed(record)
+                    except Exception:
+                        pass
+        finally:
+            checkpoint.close()
+
+        os.remove(segment)
+        checkpoint.remove()
+        return replayed
+
+    @staticmethod
+    def _read_lines(path: str) -> List[str]:
+        with open(path, encoding="utf-8") as journal_file:
+            return journal_file.readlines()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.running,
+            "write_budget_ms": int(self.write_budget * 1000),
+            "journaled": self.journaled,
+            "replayed": self.replayed,
+            "replay_duplicates": self.replay_duplicates,
+            "replay_failures": self.replay_failures,
+            "backlog_segments": len(glob.glob(os.path.join(self.directory, "*.sealed")))
+            + len([path for path in glob.glob(os.path.join(self.directory, "*.replaying-*")) if _is_segment(path)])
+        }
+
+
+scan_journal = ScanJournal(
+    directory=settings.scan_journal_dir,
+    write_budget_ms=settings.scan_journal_write_budget_ms,
+    replay_interval_seconds=settings.scan_journal_replay_interval_seconds
+)
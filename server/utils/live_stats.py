@@ -0,0 +1,274 @@
+"""
+Live session statistics
+In-memory attendance counters per session, seeded once from MongoDB and
+updated on every recorded scan
+"""
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from bson import ObjectId
+from config import settings
+from models.user import UserRole
+from utils.cache import SingleFlight, TTLCache, live_stats_response_cache
+
+
+class SessionLiveStats:
+    """Counters and recent scans of one session"""
+
+    def __init__(
+        self,
+        session: dict,
+        total_students: int,
+        attendees: Dict[str, str],
+        recent: List[dict],
+        recent_size: int,
+        late: Optional[int] = None
+    ) -> None:
+        self.session = {
+            "id": str(session["_id"]),
+            "title": session.get("title"),
+            "active": session.get("active", False)
+        }
+        self.total_students = total_students
+        # user_id -> status of everyone already marked
+        self.attendees = attendees
+        self.late = late if late is not None else sum(1 for status in attendees.values() if status == "late")
+        # Most recent first
+        self.recent: Deque[dict] = deque(recent, maxlen=recent_size)
+
+    def record(self, scan: dict) -> bool:
+        """Count a scan; returns False if the user was already counted"""
+        if scan["user_id"] in self.attendees:
+            return False
+        self.attendees[scan["user_id"]] = scan["status"]
+        if scan["status"] == "late":
+            self.late += 1
+        self.recent.appendleft(scan)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        present = len(self.attendees)
+        return {
+            "total_students": self.total_students,
+            "present": present,
+            "absent": max(self.total_students - present, 0),
+            "late": self.late,
+            "percentage": round((present / self.total_students * 100) if self.total_students else 0, 2)
+        }
+
+    def recent_scans(self) -> List[dict]:
+        return list(self.recent)
+
+
+def _value(value: Any) -> Any:
+    # Records built from models still hold enum members
+    return getattr(value, "value", value)
+
+
+def _scan_entry(record: dict, user: Optional[dict]) -> dict:
+    return {
+        "id": str(record.get("_id")),
+        "user_id": record.get("user_id"),
+        "user_name": user.get("name") if user else None,
+        "user_email": user.get("email") if user else None,
+        "status": _value(record.get("status")),
+        "method": _value(record.get("method")),
+        "timestamp": record.get("timestamp"),
+    }
+
+
+def live_stats_pipeline(session_id: str, recent_size: int) -> List[dict]:
+    """
+    Aggregation computing a session's live stats in one round trip
+
+    Runs on `sessions` and returns the session's title and active flag,
+    `trainees` (count of trainees) and `attendance`: one `$facet` result
+    with the attendees and their status, per-status counts, and the most
+    recent scans joined to the scanner's name and email.
+    """
+    return [
+        {"$match": {"_id": ObjectId(session_id)}},
+        {"$project": {"title": 1, "active": 1}},
+        {
+            "$lookup": {
+                "from": "attendance_records",
+                "pipeline": [
+                    # Uses the (session_id, user_id) index
+                    {"$match": {"session_id": session_id}},
+                    {
+                        "$facet": {
+                            "attendees": [{"$project": {"_id": 0, "user_id": 1, "status": 1}}],
+                            "counts": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+                            "recent": [
+                                {"$sort": {"timestamp": -1}},
+                                {"$limit": recent_size},
+                                {
+                                    "$lookup": {
+                                        "from": "users",
+                                        "let": {
+                                            "uid": {
+                                                "$convert": {
+                                                    "input": "$user_id",
+                                                    "to": "objectId",
+                                                    "onError": None,
+                                                    "onNull": None
+                                                }
+                                            }
+                                        },
+                                        "pipeline": [
+                                            {"$match": {"$expr": {"$eq": ["$_id", "$$uid"]}}},
+                                            {"$project": {"_id": 0, "name": 1, "email": 1}}
+                                        ],
+                                        "as": "user"
+                                    }
+                                },
+                                {"$set": {"user": {"$arrayElemAt": ["$user", 0]}}}
+                            ]
+                        }
+                    }
+                ],
+                "as": "attendance"
+            }
+        },
+        {
+            "$lookup": {
+                "from": "users",
+                "pipeline": [
+                    {"$match": {"role": UserRole.TRAINEE.value}},
+                    {"$count": "count"}
+                ],
+                "as": "trainees"
+            }
+        }
+    ]
+
+
+class LiveStatsRegistry:
+    """
+    Live stats of recently watched sessions
+
+    Stats are seeded from MongoDB the first time a session is polled or
+    scanned (concurrent requests share one seed) and then kept current by
+    `record_scan`. Entries expire after `ttl_seconds` and are seeded again,
+    which bounds drift from changes made outside the scan path, such as
+    new trainees registering. Scans and deactivations handled by other
+    workers reach this one through `apply_event` when the realtime backend
+    relays them. Every change also drops the session's cached `/live`
+    response, whichever worker it came from.
+    """
+
+    def __init__(self, max_sessions: int, ttl_seconds: float, recent_size: int) -> None:
+        self.recent_size = recent_size
+        self._sessions = TTLCache(maxsize=max_sessions, ttl=ttl_seconds)
+        self._seeding = SingleFlight()
+        self.seeds = 0
+        self.scans_recorded = 0
+
+    async def get(self, db, session_id: str) -> Optional[SessionLiveStats]:
+        """Live stats of a session, or None if the session does not exist"""
+        live = self._sessions.get(session_id)
+        if live is not None:
+            return live
+
+        def store(live: Optional[SessionLiveStats]) -> None:
+            if live is not None:
+                self._sessions.set(session_id, live)
+
+        return await self._seeding.run(session_id, lambda: self._seed(db, session_id), store=store)
+
+    async def _seed(self, db, session_id: str) -> Optional[SessionLiveStats]:
+        results = await db.sessions.aggregate(
+            live_stats_pipeline(session_id, self.recent_size)
+        ).to_list(length=1)
+        if not results:
+            return None
+
+        result = results[0]
+        attendance = result["attendance"][0] if result["attendance"] else {}
+        trainees = result["trainees"][0]["count"] if result["trainees"] else 0
+        counts = {count["_id"]: count["count"] for count in attendance.get("counts", [])}
+
+        self.seeds += 1
+        return SessionLiveStats(
+            session=result,
+            total_students=trainees,
+            attendees={
+                attendee["user_id"]: attendee.get("status")
+                for attendee in attendance.get("attendees", [])
+            },
+            recent=[_scan_entry(record, record.get("user")) for record in attendance.get("recent", [])],
+            recent_size=self.recent_size,
+            late=counts.get("late", 0)
+        )
+
+    async def record_scan(
+        self,
+        db,
+        record: dict,
+        user_name: Optional[str] = None,
+        user_email: Optional[str] = None
+    ) -> Optional[SessionLiveStats]:
+        """
+        Count a newly written attendance record
+
+        Args:
+            db: Database handle
+            record: Attendance record as written to the database
+            user_name: Name of the attendee, looked up if not given
+            user_email: Email of the attendee, looked up if not given
+
+        Returns:
+            Optional[SessionLiveStats]: Updated stats, or None if the session is gone
+        """
+        live = await self.get(db, record["session_id"])
+        if live is None:
+            return None
+
+        user = {"name": user_name, "email": user_email}
+        if user_name is None:
+            try:
+                user = await db.users.find_one({"_id": ObjectId(record["user_id"])}, {"name": 1, "email": 1})
+            except Exception:
+                user = None
+
+        if live.record(_scan_entry(record, user)):
+            self.scans_recorded += 1
+        live_stats_response_cache.invalidate(record["session_id"])
+        return live
+
+    def apply_event(self, session_id: str, event: str, payload: Any) -> None:
+        """Realtime listener: apply scans and deactivations published by other workers"""
+        if event == "session_deactivated":
+            self.update_session(session_id, active=False)
+            return
+        if event != "attendance_scanned":
+            return
+        live = self._sessions.get(session_id)
+        if live is not None:
+            attendance = payload["attendance"]
+            scan = {key: attendance.get(key) for key in (
+                "id", "user_id", "user_name", "user_email", "status", "method", "timestamp"
+            )}
+            if live.record(scan):
+                self.scans_recorded += 1
+        live_stats_response_cache.invalidate(session_id)
+
+    def update_session(self, session_id: str, **fields: Any) -> None:
+        """Reflect a session change (e.g. deactivation) in cached stats"""
+        live = self._sessions.get(session_id)
+        if live is not None:
+            live.session.update(fields)
+        live_stats_response_cache.invalidate(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._sessions.stats(),
+            "seeds": self.seeds,
+            "scans_recorded": self.scans_recorded
+        }
+
+
+live_session_stats = LiveStatsRegistry(
+    max_sessions=settings.live_stats_max_sessions,
+    ttl_seconds=settings.live_stats_ttl_seconds,
+    recent_size=settings.live_stats_recent_size
+)
@@ -0,0 +1,66 @@
+"""
+Keyset pagination helpers
+Opaque cursors carrying the sort key of the last row of a page
+"""
+import base64
+import binascii
+from typing import Any, List, Tuple, Type, Union
+from bson import json_util
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode the sort key of a page's last row (ObjectIds and datetimes included)"""
+    return base64.urlsafe_b64encode(json_util.dumps(list(values)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: Union[Type, Tuple[Type, ...]]) -> List[Any]:
+    """
+    Decode a cursor produced by `encode_cursor`
+
+    The values end up in query filters, so each must have the type the
+    call site expects; anything else (e.g. an operator document) is refused.
+
+    Args:
+        cursor: Cursor sent by the client
+        types: Expected type (or tuple of types) of each value
+
+    Raises:
+        ValueError: The cursor is malformed or its values are not of `types`
+    """
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("Invalid cursor")
+    for value, expected in zip(values, types):
+        # bool is an int subclass but never a valid sort key here
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise ValueError("Invalid cursor")
+    return values
+
+
+def keyset_after(fields: List[Tuple[str, int]], values: List[Any]) -> dict:
+    """
+    `$match` filter for the rows after `values` in the order given by `fields`
+
+    Args:
+        fields: (field, direction) pairs of the sort, the last one unique
+        values: Sort key of the last row already returned
+
+    Returns:
+        dict: Filter of the form {$or: [{a: {$gt: x}}, {a: x, b: {$gt: y}}, ...]}
+    """
+    branches = []
+    for position, (field, direction) in enumerate(fields):
+        branch = {name: value for (name, _), value in zip(fields[:position], values)}
+        branch[field] = {"$gt" if direction > 0 else "$lt": values[position]}
+        branches.append(branch)
+    return {"$or": branches}
+
+
+def page_size(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
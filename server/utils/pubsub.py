@@ -0,0 +1,199 @@
+"""
+Realtime pub/sub backends
+Carry websocket events between application workers
+"""
+import asyncio
+import os
+import socket
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+from database import get_database
+
+# Called with (session_id, event, payload) for every event this worker must deliver
+DeliverCallback = Callable[[str, str, Any], Awaitable[None]]
+
+
+class LocalPubSub:
+    """
+    In-process backend for single-worker deployments
+
+    Events are delivered straight to this worker's subscribers.
+    """
+
+    name = "local"
+
+    def __init__(self) -> None:
+        self._deliver: Optional[DeliverCallback] = None
+        self.published = 0
+
+    async def start(self, deliver: DeliverCallback) -> None:
+        self._deliver = deliver
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, session_id: str, event: str, payload: Any) -> None:
+        self.published += 1
+        if self._deliver:
+            await self._deliver(session_id, event, payload)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "published": self.published}
+
+
+class MongoPubSub:
+    """
+    Backend relaying events through a capped MongoDB collection
+
+    The publishing worker delivers to its own subscribers immediately and
+    appends the event to `realtime_events`. Every worker tails that
+    collection with a tailable cursor and delivers events written by other
+    workers. Works on a standalone server (no replica set needed).
+
+    Positions are tracked by the `_id` of the last event read, never by
+    timestamps: events are written with each publisher's clock, so a
+    restarted cursor walks the collection in insertion (`$natural`) order
+    and resumes right after that `_id`.
+    """
+
+    name = "mongo"
+
+    def __init__(self, collection_name: str, collection_bytes: int) -> None:
+        self.collection_name = collection_name
+        self.collection_bytes = collection_bytes
+        self.origin = f"{socket.gethostname()}:{os.getpid()}"
+        self._deliver: Optional[DeliverCallback] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+        # Recently delivered event ids, to skip events seen again after a cursor restart
+        self._seen: Deque[ObjectId] = deque(maxlen=4096)
+        self._seen_ids: Set[ObjectId] = set()
+
+        self.published = 0
+        self.publish_failures = 0
+        self.received = 0
+        self.cursor_restarts = 0
+        self.latency_total_ms = 0.0
+        self.latency_max_ms = 0.0
+        self.last_latency_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, deliver: DeliverCallback) -> None:
+        self._deliver = deliver
+        db = get_database()
+        try:
+            await db.create_collection(self.collection_name, capped=True, size=self.collection_bytes)
+        except CollectionInvalid:
+            pass  # Already created by another worker
+
+        # A tailable cursor dies on an empty result, so start from our own marker
+        marker = {"_id": ObjectId(), "origin": self.origin, "event": None, "published_at": datetime.utcnow()}
+        await db[self.collection_name].insert_one(marker)
+        if not self.running:
+            self._task = asyncio.create_task(self._run(marker["_id"]))
+
+    async def stop(self) -> None:
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, session_id: str, event: str, payload: Any) -> None:
+        self.published += 1
+        if self._deliver:
+            await self._deliver(session_id, event, payload)
+
+        # Relay in the background so publishers never wait on the database
+        task = asyncio.create_task(self._append({
+            "origin": self.origin,
+            "session_id": session_id,
+            "event": event,
+            "data": payload,
+            "published_at": datetime.utcnow(),
+            "sent": time.time()
+        }))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _append(self, document: dict) -> None:
+        try:
+            await get_database()[self.collection_name].insert_one(document)
+        except Exception as e:
+            # Local subscribers already have the event; other workers miss it
+            self.publish_failures += 1
+            print(f"⚠️  Realtime publish failed: {e}")
+
+    async def _run(self, last_id: ObjectId) -> None:
+        collection = get_database()[self.collection_name]
+        while True:
+            try:
+                # Once the last event read has been overwritten there is no
+                # position to resume from; deliver everything still there
+                skipping = await collection.find_one({"_id": last_id}, {"_id": 1}) is not None
+                cursor = collection.find(
+                    {},
+                    cursor_type=CursorType.TAILABLE_AWAIT,
+                    max_await_time_ms=1000
+                ).sort("$natural", 1)
+                while cursor.alive:
+                    async for document in cursor:
+                        if skipping:
+                            skipping = document["_id"] != last_id
+                            continue
+                        last_id = document["_id"]
+                        await self._receive(document)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Realtime event cursor failed: {e}")
+
+            # The cursor dies if the capped collection wraps past it
+            self.cursor_restarts += 1
+            await asyncio.sleep(0.5)
+
+    async def _receive(self, document: dict) -> None:
+        event_id = document["_id"]
+        if event_id in self._seen_ids or document["origin"] == self.origin or not document.get("event"):
+            return
+        if len(self._seen) == self._seen.maxlen:
+            self._seen_ids.discard(self._seen[0])
+        self._seen.append(event_id)
+        self._seen_ids.add(event_id)
+
+        self.received += 1
+        latency_ms = max((time.time() - document.get("sent", time.time())) * 1000, 0.0)
+        self.last_latency_ms = round(latency_ms, 2)
+        self.latency_total_ms += latency_ms
+        self.latency_max_ms = max(self.latency_max_ms, latency_ms)
+
+        if self._deliver:
+            try:
+                await self._deliver(document["session_id"], document["event"], document["data"])
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "running": self.running,
+            "published": self.published,
+            "publish_failures": self.publish_failures,
+            "received": self.received,
+            "cursor_restarts": self.cursor_restarts,
+            "avg_delivery_latency_ms": round(self.latency_total_ms / self.received, 2) if self.received else 0.0,
+            "max_delivery_latency_ms": round(self.latency_max_ms, 2),
+            "last_delivery_latency_ms": self.last_latency_ms
+        }
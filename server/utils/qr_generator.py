@@ -4,10 +4,23 @@ Handles QR code creation and encoding
 """
 import qrcode
 import io
+import asyncio
+import multiprocessing
 import base64
-from datetime import datetime, timedelta
+import hashlib
+import hmac
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
 import secrets
+from bson import ObjectId
 from config import settings
+from models.qr_code import QRCodeInDB
+from utils.cache import TTLCache, seconds_until
+
+# Version prefix of signed QR tokens: v1.<session_id>.<expiry>.<nonce>.<signature>
+SIGNED_QR_VERSION = "v1"
 
 
 def generate_qr_code_value(session_id: str) -> str:
@@ -28,47 +41,354 @@ def generate_qr_code_value(session_id: str) -> str:
     return qr_value
 
 
-def create_qr_image(data: str) -> str:
+def _sign_qr_payload(payload: str) -> str:
     """
-    Create QR code image and return as base64 encoded string
+    Compute the URL-safe HMAC-SHA256 signature of a signed QR payload
     
     Args:
-        data: Data to encode in QR code
+        payload: Token without its signature part
     
     Returns:
-        str: Base64 encoded QR code image
+        str: Base64url encoded signature without padding
     """
+    key = (settings.qr_signing_key or settings.secret_key).encode()
+    digest = hmac.new(key, payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def generate_signed_qr_value(session_id: str, expires_at: datetime) -> str:
+    """
+    Generate a stateless QR code value that carries its own session and expiry
+    
+    The value can be verified with `parse_signed_qr_value` without a
+    database lookup, so it never needs to be stored in `qr_codes`.
+    
+    Args:
+        session_id: ID of the session
+        expires_at: Expiry timestamp (naive UTC)
+    
+    Returns:
+        str: Signed QR code value
+    """
+    expiry = int(expires_at.replace(tzinfo=timezone.utc).timestamp())
+    nonce = secrets.token_urlsafe(12)
+    
+    payload = f"{SIGNED_QR_VERSION}.{session_id}.{expiry}.{nonce}"
+    return f"{payload}.{_sign_qr_payload(payload)}"
+
+
+def parse_signed_qr_value(qr_value: str) -> Optional[Tuple[str, datetime]]:
+    """
+    Verify a signed QR code value in memory
+    
+    Args:
+        qr_value: Scanned QR code value
+    
+    Returns:
+        Optional[Tuple[str, datetime]]: (session_id, expires_at) if the
+        signature is valid, None if the value is malformed or forged.
+        Expiry is not checked here; use `is_qr_expired`.
+    """
+    parts = qr_value.split(".")
+    if len(parts) != 5 or parts[0] != SIGNED_QR_VERSION:
+        return None
+    
+    payload, signature = qr_value.rsplit(".", 1)
+    # Compare bytes: compare_digest raises TypeError on non-ASCII str
+    if not hmac.compare_digest(signature.encode(), _sign_qr_payload(payload).encode()):
+        return None
+    
+    try:
+        expires_at = datetime.utcfromtimestamp(int(parts[2]))
+    except (ValueError, OverflowError):
+        return None
+    
+    return parts[1], expires_at
+
+
+# Media types of the supported QR image formats
+QR_IMAGE_MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml"
+}
+
+
+def _build_qr(data: str, box_size: int, border: int) -> qrcode.QRCode:
     # Create QR code instance
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        box_size=box_size,
+        border=border,
     )
     
     # Add data and generate
     qr.add_data(data)
     qr.make(fit=True)
+    return qr
+
+
+def create_qr_png(data: str, box_size: int = 10, border: int = 4) -> bytes:
+    """
+    Create QR code image as PNG bytes
     
-    # Create image
-    img = qr.make_image(fill_color="black", back_color="white")
+    Args:
+        data: Data to encode in QR code
+        box_size: Pixels per QR module
+        border: Quiet zone width in modules
+    
+    Returns:
+        bytes: PNG image
+    """
+    img = _build_qr(data, box_size, border).make_image(fill_color="black", back_color="white")
     
-    # Convert to base64
     buffer = io.BytesIO()
     img.save(buffer, format='PNG')
-    buffer.seek(0)
-    img_base64 = base64.b64encode(buffer.getvalue()).decode()
+    return buffer.getvalue()
+
+
+def create_qr_svg(data: str, border: int = 4) -> bytes:
+    """
+    Create QR code image as a compact, scalable SVG
+    
+    Each horizontal run of dark modules becomes one path segment, which is
+    far smaller than one element per module.
+    
+    Args:
+        data: Data to encode in QR code
+        border: Quiet zone width in modules
+    
+    Returns:
+        bytes: SVG document
+    """
+    matrix = _build_qr(data, 1, border).get_matrix()
+    size = len(matrix)
+    
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            path.append(f"M{start} {y}h{x - start}v1H{start}z")
+    
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(path)}"/></svg>'
+    ).encode()
+
+
+def create_qr_image(data: str, box_size: int = 10, border: int = 4) -> str:
+    """
+    Create QR code image and return as base64 encoded string
+    
+    Args:
+        data: Data to encode in QR code
+        box_size: Pixels per QR module
+        border: Quiet zone width in modules
+    
+    Returns:
+        str: Base64 encoded QR code image
+    """
+    return base64.b64encode(create_qr_png(data, box_size, border)).decode()
+
+
+def _render_qr_bytes(data: str, image_format: str, box_size: int, border: int) -> bytes:
+    # Module-level so it can run in the render process pool
+    if image_format == "svg":
+        return create_qr_svg(data, border)
+    return create_qr_png(data, box_size, border)
+
+
+def qr_image_etag(data: str, image_format: str = "png", box_size: int = 10, border: int = 4) -> str:
+    """
+    Strong ETag for a rendered QR image
+    
+    The image is fully determined by the code value and render parameters,
+    so the tag can be computed without rendering.
+    """
+    digest = hashlib.sha256(f"{data}|{image_format}|{box_size}|{border}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+class QRImageCache(TTLCache):
+    """Byte-bounded cache of rendered QR images that also tracks render time"""
+    
+    def __init__(self, maxsize: int, ttl: float, max_bytes: int) -> None:
+        super().__init__(maxsize=maxsize, ttl=ttl, max_bytes=max_bytes, sizeof=len)
+        self.renders = 0
+        self.render_seconds = 0.0
+    
+    def record_render(self, seconds: float) -> None:
+        self.renders += 1
+        self.render_seconds += seconds
+    
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["renders"] = self.renders
+        stats["avg_render_ms"] = round(self.render_seconds / self.renders * 1000, 2) if self.renders else 0.0
+        return stats
+
+
+# Rendered images keyed by (code_value, box_size, border, format); entries
+# never outlive the code they encode
+qr_image_cache = QRImageCache(
+    maxsize=settings.qr_image_cache_max_entries,
+    ttl=settings.qr_code_expiry_minutes * 60,
+    max_bytes=settings.qr_image_cache_max_bytes
+)
+
+
+# Worker processes for CPU-bound QR rendering, created on first use
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_render_pool() -> Optional[ProcessPoolExecutor]:
+    global _render_pool
+    if _render_pool is None and settings.qr_render_processes > 0:
+        # By then Motor and the bcrypt pool run threads, and forking a
+        # multi-threaded process can deadlock the child; spawn fresh ones
+        _render_pool = ProcessPoolExecutor(
+            max_workers=settings.qr_render_processes,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _render_pool
+
+
+def shutdown_render_pool() -> None:
+    """Stop the QR render worker processes"""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+async def render_qr_image_bytes(
+    data: str,
+    expires_at: datetime,
+    image_format: str = "png",
+    box_size: int = 10,
+    border: int = 4
+) -> bytes:
+    """
+    Return the rendered image for a QR code value, rendering it only on a cache miss
+    
+    Rendering runs in a worker process (`QR_RENDER_PROCESSES`) so PIL work
+    never blocks the event loop.
+    
+    Args:
+        data: Data to encode in QR code
+        expires_at: Expiry of the QR code; the cached image expires with it
+        image_format: "png" or "svg"
+        box_size: Pixels per QR module (PNG only)
+        border: Quiet zone width in modules
     
-    return img_base64
+    Returns:
+        bytes: Raw image
+    """
+    key = (data, box_size, border, image_format)
+    image = qr_image_cache.get(key)
+    if image is None:
+        started = time.perf_counter()
+        pool = _get_render_pool()
+        if pool:
+            loop = asyncio.get_running_loop()
+            image = await loop.run_in_executor(pool, _render_qr_bytes, data, image_format, box_size, border)
+        else:
+            image = _render_qr_bytes(data, image_format, box_size, border)
+        qr_image_cache.record_render(time.perf_counter() - started)
+        qr_image_cache.set(key, image, ttl=seconds_until(expires_at))
+    return image
+
+
+async def render_qr_image(data: str, expires_at: datetime, box_size: int = 10, border: int = 4) -> str:
+    """
+    Return the base64 PNG for a QR code value, rendering it only on a cache miss
+    
+    Args:
+        data: Data to encode in QR code
+        expires_at: Expiry of the QR code; the cached image expires with it
+        box_size: Pixels per QR module
+        border: Quiet zone width in modules
+    
+    Returns:
+        str: Base64 encoded QR code image
+    """
+    image = await render_qr_image_bytes(data, expires_at, "png", box_size, border)
+    return base64.b64encode(image).decode()
+
+
+async def issue_session_qr_code(
+    db,
+    session_id: str,
+    only_if_expires_at: Optional[datetime] = None
+) -> Optional[Tuple[str, datetime]]:
+    """
+    Generate a new QR code for a session and make it the session's current one
+    
+    The current code and its expiry are kept on the session document. In
+    random token mode the code is also inserted into `qr_codes` so scans
+    can resolve it; signed codes need no stored copy.
+    
+    Args:
+        db: Database instance
+        session_id: ID of the session
+        only_if_expires_at: Only replace the current code if it still has
+            this expiry (lets concurrent rotators race safely)
+    
+    Returns:
+        Optional[Tuple[str, datetime]]: (code_value, expires_at), or None if
+        the current code had already been replaced
+    """
+    expires_at = get_qr_expiry_time()
+    update = {"qr_expires_at": expires_at}
+    
+    if settings.qr_token_mode == "signed":
+        qr_code_value = generate_signed_qr_value(session_id, expires_at)
+    else:
+        qr_code_value = generate_qr_code_value(session_id)
+        qr_code_id = ObjectId()
+        update["qr_code_id"] = str(qr_code_id)
+    update["qr_code_value"] = qr_code_value
+    
+    query = {"_id": ObjectId(session_id)}
+    if only_if_expires_at is not None:
+        query["qr_expires_at"] = only_if_expires_at
+    
+    result = await db.sessions.update_one(query, {"$set": update})
+    if only_if_expires_at is not None and result.modified_count == 0:
+        return None
+    
+    if settings.qr_token_mode != "signed":
+        qr_code_in_db = QRCodeInDB(
+            session_id=session_id,
+            code_value=qr_code_value,
+            expires_at=expires_at
+        )
+        await db.qr_codes.insert_one({"_id": qr_code_id, **qr_code_in_db.model_dump()})
+    
+    return qr_code_value, expires_at
 
 
 def get_qr_expiry_time() -> datetime:
     """
     Calculate QR code expiry time
     
+    With rotation enabled, a code lives for one rotation period plus a grace
+    period so scans of the previous code still succeed right after a rotation.
+    
     Returns:
         datetime: Expiry timestamp
     """
+    if settings.qr_rotation_enabled:
+        return datetime.utcnow() + timedelta(
+            seconds=settings.qr_rotation_seconds + settings.qr_rotation_grace_seconds
+        )
     return datetime.utcnow() + timedelta(minutes=settings.qr_code_expiry_minutes)
 
 
@@ -0,0 +1,129 @@
+"""
+QR code rotation
+Periodically replaces the QR code of live sessions, pre-renders the new
+code and notifies realtime subscribers that it changed
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from config import settings
+from database import get_database
+from utils.qr_generator import issue_session_qr_code, render_qr_image
+from utils.realtime import realtime_manager
+
+
+class QRRotator:
+    """
+    Background task that rotates the QR code of every live session
+
+    A session is live while it is active and between its start and end
+    time. Sessions only rotate once a code has been issued for them (i.e.
+    someone opened the QR screen). The next code is issued and rendered
+    `lead_seconds` before the current one is due, so the instructor screen
+    never waits on a render; the previous code keeps working until its
+    grace period ends.
+
+    Realtime subscriptions are unauthenticated, so `qr_rotated` only says
+    that the code changed; the instructor screen refetches it from the
+    Admin/Instructor-only `/sessions/{id}/qr`.
+    """
+
+    def __init__(self, rotation_seconds: int, grace_seconds: int, lead_seconds: int) -> None:
+        self.rotation = timedelta(seconds=rotation_seconds)
+        self.grace = timedelta(seconds=grace_seconds)
+        self.lead = timedelta(seconds=lead_seconds)
+        self.tick_seconds = max(lead_seconds / 2, 1)
+        self._task: Optional[asyncio.Task] = None
+
+        self.rotations = 0
+        self.failures = 0
+        self.last_tick_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            try:
+                await self.rotate_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                print(f"⚠️  QR rotation failed: {e}")
+            self.last_tick_ms = round((time.perf_counter() - started) * 1000, 2)
+            await asyncio.sleep(self.tick_seconds)
+
+    async def rotate_due(self) -> int:
+        """Rotate every live session whose code is due within the lead time"""
+        db = get_database()
+        now = datetime.utcnow()
+
+        # A code is due once it is within its grace period (+ lead time) of expiring
+        due = await db.sessions.find(
+            {
+                "active": True,
+                "start_time": {"$lte": now + self.rotation},
+                "end_time": {"$gte": now},
+                "qr_expires_at": {"$lte": now + self.grace + self.lead}
+            },
+            {"qr_expires_at": 1}
+        ).to_list(length=None)
+
+        results = await asyncio.gather(
+            *[self._rotate(db, session) for session in due],
+            return_exceptions=True
+        )
+        return sum(1 for result in results if result is True)
+
+    async def _rotate(self, db, session: dict) -> bool:
+        session_id = str(session["_id"])
+
+        # Only one worker wins the compare-and-set on the current expiry
+        issued = await issue_session_qr_code(db, session_id, only_if_expires_at=session["qr_expires_at"])
+        if not issued:
+            return False
+
+        qr_code_value, expires_at = issued
+        # Warm the image cache for the refetch the notice triggers
+        await render_qr_image(qr_code_value, expires_at)
+        self.rotations += 1
+
+        await realtime_manager.broadcast(
+            session_id=session_id,
+            event="qr_rotated",
+            payload={"session_id": session_id, "expires_at": expires_at}
+        )
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.running,
+            "rotation_seconds": int(self.rotation.total_seconds()),
+            "rotations": self.rotations,
+            "failures": self.failures,
+            "last_tick_ms": self.last_tick_ms
+        }
+
+
+qr_rotator = QRRotator(
+    rotation_seconds=settings.qr_rotation_seconds,
+    grace_seconds=settings.qr_rotation_grace_seconds,
+    lead_seconds=settings.qr_rotation_lead_seconds
+)
@@ -2,46 +2,469 @@
 Realtime connection manager for websocket subscriptions.
 Manages subscribers by session and broadcasts events.
 """
-from typing import Dict, Set, Any
+from typing import Callable, Dict, Any, List, Optional, Set, Union
+from datetime import datetime
 from starlette.websockets import WebSocket
+from bson import ObjectId
 import asyncio
+import json
+import random
+import time
+from config import settings
+from utils.pubsub import LocalPubSub, MongoPubSub
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# What to do when a subscriber's outbound queue is full
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+# Events merged into one `attendance_batch` frame when coalescing is on
+COALESCED_EVENTS = {"attendance_scanned"}
+
+# Subscribe to every session (admins only)
+FIREHOSE = "*"
+
+# Called with (session_id, event, payload) for every event reaching this worker
+EventListener = Callable[[str, str, Any], None]
+
+# Close codes
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(value: Any) -> str:
+    """
+    Serialize a value to compact JSON text
+
+    Uses orjson when it is installed. Datetimes are written in ISO 8601
+    like the REST API does.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_json_default).decode()
+    return json.dumps(value, default=_json_default, separators=(",", ":"))
+
+
+def encode_event(event: str, payload: Any, session_id: Optional[str] = None) -> str:
+    """Serialize a realtime event to the JSON text sent over the websocket"""
+    if session_id is None:
+        return encode_json({"event": event, "data": payload})
+    return encode_json({"event": event, "session_id": session_id, "data": payload})
+
+
+class _Connection:
+    """A websocket with its subscriptions, outbound queue and writer task"""
+
+    __slots__ = ("websocket", "session_ids", "firehose_rate", "queue", "writer", "closing", "last_seen")
+
+    def __init__(self, websocket: WebSocket, queue_size: int) -> None:
+        self.websocket = websocket
+        self.session_ids: Set[str] = set()
+        # Fraction of all sessions' events sent to a firehose subscriber (0 = not subscribed)
+        self.firehose_rate = 0.0
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.closing = False
+        # Monotonic time of the last frame received from the client
+        self.last_seen = time.monotonic()
 
 
 class RealtimeManager:
-    def __init__(self) -> None:
-        # session_id -> set of websockets
-        self._session_subscribers: Dict[str, Set[WebSocket]] = {}
-        self._lock = asyncio.Lock()
+    """
+    Tracks websocket subscriptions and fans events out to them
+
+    One connection can subscribe to any number of sessions, or to the
+    firehose of every session with server-side sampling. Subscriptions are
+    indexed both ways: session -> connections for fan-out and
+    connection -> sessions for cleanup.
+
+    Every connection has a bounded queue drained by its own writer task, so
+    `broadcast` only enqueues and never waits on a client. When a slow
+    client's queue is full, its oldest pending event is dropped or the
+    client is disconnected, depending on `slow_consumer_policy`.
+
+    With a coalescing window, `attendance_scanned` events of a session are
+    collected for up to `coalesce_window_ms` and sent as one
+    `attendance_batch` frame. Any other event flushes the pending batch
+    first, so subscribers still see events in order.
+
+    A heartbeat task sends a `ping` event every `ping_interval_seconds`;
+    clients answer with any frame (normally `{"event": "pong"}`). Sockets
+    silent for longer than the interval plus `pong_timeout_seconds` are
+    closed, which reaps half-open connections. New connections beyond
+    `max_connections` (per worker) are closed with 1013 (try again later);
+    subscriptions beyond `max_connections_per_session` or
+    `max_subscriptions_per_connection` are refused. A limit of 0 means
+    unlimited.
+    """
+
+    def __init__(
+        self,
+        backend: Union[LocalPubSub, MongoPubSub],
+        queue_size: int,
+        slow_consumer_policy: str,
+        coalesce_window_ms: int = 0,
+        ping_interval_seconds: float = 0,
+        pong_timeout_seconds: float = 0,
+        max_connections: int = 0,
+        max_connections_per_session: int = 0,
+        max_subscriptions_per_connection: int = 0
+    ) -> None:
+        # websocket -> connection
+        self._connections: Dict[WebSocket, _Connection] = {}
+        # session_id -> websocket -> connection
+        self._session_subscribers: Dict[str, Dict[WebSocket, _Connection]] = {}
+        # Connections subscribed to every session
+        self._firehose: Dict[WebSocket, _Connection] = {}
+        # Carries events to the subscribers of every worker
+        self.backend = backend
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self._closing: Set[asyncio.Task] = set()
+        self.coalesce_window = coalesce_window_ms / 1000
+        # session_id -> payloads waiting for the end of the window, and its timer
+        self._batches: Dict[str, List[Any]] = {}
+        self._batch_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._listeners: List[EventListener] = []
+        self.ping_interval = ping_interval_seconds
+        self.pong_timeout = pong_timeout_seconds
+        self.max_connections = max_connections
+        self.max_connections_per_session = max_connections_per_session
+        self.max_subscriptions_per_connection = max_subscriptions_per_connection
+        self._heartbeat: Optional[asyncio.Task] = None
+
+        self.sent = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+        self.send_failures = 0
+        self.batches_sent = 0
+        self.events_coalesced = 0
+        self.rejected = 0
+        self.reaped = 0
+        self.firehose_sampled_out = 0
+
+    async def start(self) -> None:
+        await self.backend.start(self._deliver)
+        if self.ping_interval > 0 and (self._heartbeat is None or self._heartbeat.done()):
+            self._heartbeat = asyncio.create_task(self._run_heartbeat())
 
-    async def connect(self, websocket: WebSocket, session_id: str) -> None:
+    async def stop(self) -> None:
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+        await self.backend.stop()
+        for session_id in list(self._batch_timers):
+            self._flush_batch(session_id)
+        writers = [connection.writer for connection in self._connections.values() if connection.writer]
+        for writer in writers:
+            writer.cancel()
+        await asyncio.gather(*writers, return_exceptions=True)
+
+    def add_listener(self, listener: EventListener) -> None:
+        """Observe every event delivered to this worker, subscribed or not"""
+        self._listeners.append(listener)
+
+    async def connect(self, websocket: WebSocket) -> bool:
+        """
+        Accept and register a websocket
+
+        Returns:
+            bool: False if the connection limit was hit and the socket was closed
+        """
         await websocket.accept()
-        async with self._lock:
-            if session_id not in self._session_subscribers:
-                self._session_subscribers[session_id] = set()
-            self._session_subscribers[session_id].add(websocket)
+        if self.max_connections and len(self._connections) >= self.max_connections:
+            self.rejected += 1
+            try:
+                await websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason="Too many connections")
+            except Exception:
+                pass
+            return False
 
-    async def disconnect(self, websocket: WebSocket, session_id: str) -> None:
-        async with self._lock:
-            subscribers = self._session_subscribers.get(session_id)
-            if subscribers and websocket in subscribers:
-                subscribers.remove(websocket)
-            if subscribers is not None and len(subscribers) == 0:
+        connection = _Connection(websocket, self.queue_size)
+        connection.writer = asyncio.create_task(self._write(connection))
+        self._connections[websocket] = connection
+        return True
+
+    def subscribe(self, websocket: WebSocket, session_id: str) -> bool:
+        """
+        Subscribe a connection to a session's events
+
+        Returns:
+            bool: False if a subscription limit was hit
+        """
+        connection = self._connections.get(websocket)
+        if connection is None:
+            return False
+        if session_id in connection.session_ids:
+            return True
+
+        subscribers = self._session_subscribers.get(session_id, {})
+        if (self.max_connections_per_session and len(subscribers) >= self.max_connections_per_session) or (
+            self.max_subscriptions_per_connection
+            and len(connection.session_ids) >= self.max_subscriptions_per_connection
+        ):
+            self.rejected += 1
+            return False
+
+        self._session_subscribers.setdefault(session_id, subscribers)[websocket] = connection
+        connection.session_ids.add(session_id)
+        return True
+
+    def unsubscribe(self, websocket: WebSocket, session_id: str) -> None:
+        connection = self._connections.get(websocket)
+        if connection is None:
+            return
+        connection.session_ids.discard(session_id)
+        subscribers = self._session_subscribers.get(session_id)
+        if subscribers is not None:
+            subscribers.pop(websocket, None)
+            if not subscribers:
                 self._session_subscribers.pop(session_id, None)
 
+    def subscribe_firehose(self, websocket: WebSocket, sample_rate: float) -> None:
+        """Receive a sampled share (0 < rate <= 1) of every session's events; 0 unsubscribes"""
+        connection = self._connections.get(websocket)
+        if connection is None:
+            return
+        connection.firehose_rate = min(max(sample_rate, 0.0), 1.0)
+        if connection.firehose_rate > 0:
+            self._firehose[websocket] = connection
+        else:
+            self._firehose.pop(websocket, None)
+
+    def send(self, websocket: WebSocket, event: str, payload: Any) -> None:
+        """Queue an event for one connection (e.g. a control message reply)"""
+        connection = self._connections.get(websocket)
+        if connection:
+            self._enqueue(connection, encode_event(event, payload))
+
+    def touch(self, websocket: WebSocket) -> None:
+        """Record that the client sent something (pong or any other frame)"""
+        connection = self._connections.get(websocket)
+        if connection:
+            connection.last_seen = time.monotonic()
+
+    async def disconnect(self, websocket: WebSocket) -> None:
+        connection = self._connections.pop(websocket, None)
+        if connection is None:
+            return
+        self._firehose.pop(websocket, None)
+        for session_id in list(connection.session_ids):
+            subscribers = self._session_subscribers.get(session_id)
+            if subscribers is not None:
+                subscribers.pop(websocket, None)
+                if not subscribers:
+                    self._session_subscribers.pop(session_id, None)
+        connection.session_ids.clear()
+
+        if connection.writer and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
     async def broadcast(self, session_id: str, event: str, payload: Any) -> None:
+        """Publish an event to the subscribers of a session on every worker"""
+        await self.backend.publish(session_id, event, payload)
+
+    async def _deliver(self, session_id: str, event: str, payload: Any) -> None:
+        for listener in self._listeners:
+            try:
+                listener(session_id, event, payload)
+            except Exception:
+                pass
+
+        if session_id not in self._session_subscribers and not self._firehose:
+            return
+
+        if self.coalesce_window > 0:
+            if event in COALESCED_EVENTS:
+                self._add_to_batch(session_id, payload)
+                return
+            # Keep ordering: anything already batched goes out first
+            self._flush_batch(session_id)
+
+        self._fanout(session_id, event, payload)
+
+    def _add_to_batch(self, session_id: str, payload: Any) -> None:
+        batch = self._batches.setdefault(session_id, [])
+        batch.append(payload)
+        self.events_coalesced += 1
+        if session_id not in self._batch_timers:
+            self._batch_timers[session_id] = asyncio.get_running_loop().call_later(
+                self.coalesce_window, self._flush_batch, session_id
+            )
+
+    def _flush_batch(self, session_id: str) -> None:
+        timer = self._batch_timers.pop(session_id, None)
+        if timer:
+            timer.cancel()
+        batch = self._batches.pop(session_id, None)
+        if not batch:
+            return
+
+        scans = [payload.get("attendance", payload) for payload in batch]
+        self.batches_sent += 1
+        self._fanout(session_id, "attendance_batch", {
+            "session_id": session_id,
+            "scans": scans,
+            "counters": {
+                "scans": len(scans),
+                "present": sum(1 for scan in scans if scan.get("status") == "present"),
+                "late": sum(1 for scan in scans if scan.get("status") == "late")
+            },
+            # Session totals as of the last scan in the batch
+            "stats": batch[-1].get("stats")
+        })
+
+    def _fanout(self, session_id: str, event: str, payload: Any) -> None:
+        subscribers = self._session_subscribers.get(session_id)
+        if not subscribers and not self._firehose:
+            return
+
+        # Serialize once; every subscriber gets the same text frame
+        message = encode_event(event, payload, session_id)
         # Copy to avoid mutation during iteration
-        subscribers = list(self._session_subscribers.get(session_id, set()))
-        for ws in subscribers:
+        for connection in list(subscribers.values()) if subscribers else []:
+            self._enqueue(connection, message)
+
+        if self._firehose:
+            sample = random.random()
+            for connection in list(self._firehose.values()):
+                # Already sent through an explicit subscription
+                if session_id in connection.session_ids:
+                    continue
+                if sample < connection.firehose_rate:
+                    self._enqueue(connection, message)
+                else:
+                    self.firehose_sampled_out += 1
+
+    def _enqueue(self, connection: _Connection, message: str) -> None:
+        try:
+            connection.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.slow_consumer_policy == DISCONNECT:
+            if not connection.closing:
+                connection.closing = True
+                self.slow_disconnects += 1
+                self._schedule_close(connection, CLOSE_POLICY_VIOLATION, "Too slow")
+            return
+
+        # Keep the newest state: drop the oldest pending event
+        connection.queue.get_nowait()
+        connection.queue.put_nowait(message)
+        self.dropped += 1
+
+    async def _write(self, connection: _Connection) -> None:
+        while True:
+            message = await connection.queue.get()
             try:
-                await ws.send_json({"event": event, "data": payload})
+                await connection.websocket.send_text(message)
+                self.sent += 1
             except Exception:
                 # Best-effort: cleanup broken sockets
-                try:
-                    await self.disconnect(ws, session_id)
-                except Exception:
-                    pass
+                self.send_failures += 1
+                await self.disconnect(connection.websocket)
+                return
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            try:
+                self._heartbeat_tick()
+            except Exception as e:
+                print(f"⚠️  Websocket heartbeat failed: {e}")
+
+    def _heartbeat_tick(self) -> None:
+        """Reap silent sockets and ping the rest"""
+        deadline = time.monotonic() - (self.ping_interval + self.pong_timeout)
+        ping = encode_event("ping", {"ts": time.time()})
+        for connection in list(self._connections.values()):
+            if connection.closing:
+                continue
+            if connection.last_seen < deadline:
+                connection.closing = True
+                self.reaped += 1
+                self._schedule_close(connection, CLOSE_GOING_AWAY, "Heartbeat timeout")
+            else:
+                self._enqueue(connection, ping)
+
+    def _schedule_close(self, connection: _Connection, code: int, reason: str) -> None:
+        task = asyncio.create_task(self._close(connection, code=code, reason=reason))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, connection: _Connection, code: int, reason: str) -> None:
+        await self.disconnect(connection.websocket)
+        try:
+            await connection.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        # Busiest sessions first
+        per_session = sorted(
+            ((session_id, len(subscribers)) for session_id, subscribers in self._session_subscribers.items()),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        return {
+            "connections": len(self._connections),
+            "sessions": len(self._session_subscribers),
+            "subscriptions": sum(len(subscribers) for subscribers in self._session_subscribers.values()),
+            "firehose_subscribers": len(self._firehose),
+            "connections_per_session": dict(per_session[:20]),
+            "max_connections": self.max_connections,
+            "max_connections_per_session": self.max_connections_per_session,
+            "rejected": self.rejected,
+            "reaped": self.reaped,
+            "queued": sum(connection.queue.qsize() for connection in self._connections.values()),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "send_failures": self.send_failures,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "coalesce_window_ms": int(self.coalesce_window * 1000),
+            "batches_sent": self.batches_sent,
+            "events_coalesced": self.events_coalesced,
+            "firehose_sampled_out": self.firehose_sampled_out,
+            **self.backend.stats()
+        }
 
 
-realtime_manager = RealtimeManager()
+def _create_backend() -> Union[LocalPubSub, MongoPubSub]:
+    if settings.realtime_backend == "mongo":
+        return MongoPubSub(
+            collection_name="realtime_events",
+            collection_bytes=settings.realtime_events_collection_bytes
+        )
+    return LocalPubSub()
 
 
+realtime_manager = RealtimeManager(
+    _create_backend(),
+    queue_size=settings.realtime_send_queue_size,
+    slow_consumer_policy=settings.realtime_slow_consumer_policy,
+    coalesce_window_ms=settings.realtime_coalesce_window_ms,
+    ping_interval_seconds=settings.realtime_ping_interval_seconds,
+    pong_timeout_seconds=settings.realtime_pong_timeout_seconds,
+    max_connections=settings.realtime_max_connections,
+    max_connections_per_session=settings.realtime_max_connections_per_session,
+    max_subscriptions_per_connection=settings.realtime_max_subscriptions_per_connection
+)
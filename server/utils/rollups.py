@@ -0,0 +1,218 @@
+"""
+Attendance rollups
+Hourly attendance counts per organization, status and method, kept in
+`daily_attendance_rollups` so trend charts never scan attendance_records
+"""
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Rows are hourly so charts can be bucketed into days of any timezone.
+# Offsets that are not whole hours (e.g. +05:30) are bucketed by the start
+# of each UTC hour, so up to that fraction of an hour lands on the
+# neighbouring day.
+ROLLUP_KEY_FIELDS = ("hour", "organization", "status", "method")
+
+
+def _value(value: Any) -> Any:
+    # Records built from models still hold enum members
+    return getattr(value, "value", value)
+
+
+def hour_of(timestamp: datetime) -> datetime:
+    """Start of the UTC hour containing `timestamp`, as a naive UTC datetime"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def backfill_pipeline(since: Optional[datetime] = None) -> List[dict]:
+    """
+    Aggregation rebuilding rollup rows from attendance_records
+
+    Runs on `attendance_records`, groups by attendee and hour first so
+    organizations are looked up per group rather than per record, and
+    merges the result into `daily_attendance_rollups`.
+    """
+    pipeline: List[dict] = []
+    if since:
+        pipeline.append({"$match": {"timestamp": {"$gte": since}}})
+    pipeline += [
+        {
+            "$group": {
+                "_id": {
+                    "user_id": "$user_id",
+                    "hour": {
+                        "$dateFromParts": {
+                            "year": {"$year": "$timestamp"},
+                            "month": {"$month": "$timestamp"},
+                            "day": {"$dayOfMonth": "$timestamp"},
+                            "hour": {"$hour": "$timestamp"}
+                        }
+                    },
+                    "status": "$status",
+                    "method": "$method"
+                },
+                "count": {"$sum": 1}
+            }
+        },
+        {
+            "$lookup": {
+                "from": "users",
+                "let": {
+                    "uid": {
+                        "$convert": {
+                            "input": "$_id.user_id",
+                            "to": "objectId",
+                            "onError": None,
+                            "onNull": None
+                        }
+                    }
+                },
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$uid"]}}},
+                    {"$project": {"_id": 0, "org_name": 1}}
+                ],
+                "as": "user"
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "hour": "$_id.hour",
+                    "organization": {"$ifNull": [{"$arrayElemAt": ["$user.org_name", 0]}, ""]},
+                    "status": "$_id.status",
+                    "method": "$_id.method"
+                },
+                "count": {"$sum": "$count"}
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "hour": "$_id.hour",
+                "organization": "$_id.organization",
+                "status": "$_id.status",
+                "method": "$_id.method",
+                "count": 1
+            }
+        },
+        {
+            "$merge": {
+                "into": "daily_attendance_rollups",
+                "on": list(ROLLUP_KEY_FIELDS),
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }
+        }
+    ]
+    return pipeline
+
+
+class AttendanceRollups:
+    """
+    Incrementally maintained `daily_attendance_rollups`
+
+    Every landed attendance record adds one to the row of its hour,
+    organization, status and method. Like the counters, a failed update is
+    logged but never fails the request; `backfill` rebuilds the rows.
+    """
+
+    def __init__(self) -> None:
+        self.increments = 0
+        self.failures = 0
+        self.organization_lookups = 0
+        self.backfills = 0
+        self.last_backfill: Optional[Dict[str, Any]] = None
+
+    async def _organization(self, db, user_id: str) -> str:
+        self.organization_lookups += 1
+        try:
+            user = await db.users.find_one({"_id": ObjectId(user_id)}, {"org_name": 1})
+        except InvalidId:
+            user = None
+        return (user or {}).get("org_name") or ""
+
+    async def record(self, db, record: dict, organization: Optional[str] = None) -> None:
+        """
+        Count a newly written attendance record
+
+        Args:
+            db: Database handle
+            record: Attendance record as written to the database
+            organization: Attendee's organization (from the `org` token
+                claim); looked up when not given
+        """
+        try:
+            if organization is None:
+                organization = await self._organization(db, record["user_id"])
+            key = {
+                "hour": hour_of(record["timestamp"]),
+                "organization": organization,
+                "status": _value(record["status"]),
+                "method": _value(record["method"])
+            }
+            await db.daily_attendance_rollups.update_one(key, {"$inc": {"count": 1}}, upsert=True)
+            self.increments += 1
+        except Exception as e:
+            self.failures += 1
+            print(f"⚠️  Attendance rollup update failed: {e}")
+
+    async def backfill(self, db, since: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Rebuild rollup rows from attendance_records
+
+        Rows from `since` on (all rows without it) are deleted and
+        recomputed, so increments racing with a run may be lost; run it
+        while traffic is low.
+
+        Args:
+            db: Database handle
+            since: Only rebuild hours from this time on
+
+        Returns:
+            Dict[str, Any]: Rows written and duration
+        """
+        started = time.perf_counter()
+        since = hour_of(since) if since else None
+        # $merge needs a unique index on its key, which may not exist yet
+        # when this runs before the server ever started
+        await db.daily_attendance_rollups.create_index(
+            [(field, 1) for field in ROLLUP_KEY_FIELDS],
+            unique=True
+        )
+        await db.daily_attendance_rollups.delete_many({"hour": {"$gte": since}} if since else {})
+        await db.attendance_records.aggregate(backfill_pipeline(since), allowDiskUse=True).to_list(length=None)
+
+        report = {
+            "since": since,
+            "rows": await db.daily_attendance_rollups.count_documents({"hour": {"$gte": since}} if since else {}),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            "backfilled_at": datetime.utcnow()
+        }
+        self.backfills += 1
+        self.last_backfill = report
+        return report
+
+    async def ensure_initialized(self, db) -> None:
+        """Backfill on first start against a database that already has attendance"""
+        if (
+            await db.daily_attendance_rollups.find_one({}, {"_id": 1}) is None
+            and await db.attendance_records.find_one({}, {"_id": 1}) is not None
+        ):
+            report = await self.backfill(db)
+            print(f"📈 Attendance rollups backfilled ({report['rows']} rows, {report['duration_ms']} ms)")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "increments": self.increments,
+            "failures": self.failures,
+            "organization_lookups": self.organization_lookups,
+            "backfills": self.backfills,
+            "last_backfill": self.last_backfill
+        }
+
+
+attendance_rollups = AttendanceRollups()
@@ -0,0 +1,167 @@
+"""
+System statistics for the admin dashboard
+Totals read from the incrementally maintained counters, plus an optional
+periodically refreshed snapshot served in constant time
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from config import settings
+from database import get_database
+from utils.counters import ATTENDANCE_KEY, SESSIONS_KEY, USERS_KEY, counter_store
+
+SNAPSHOT_ID = "system"
+
+
+async def compute_system_stats(db) -> Dict[str, Any]:
+    """
+    Compute the figures returned by GET /api/admin/stats
+
+    Totals come from the `counters` collection; only the activity of the
+    last seven days is counted, on indexed timestamps. All reads run
+    concurrently.
+    """
+    seven_days_ago = datetime.utcnow() - timedelta(days=7)
+
+    counters, new_users, new_sessions, new_attendance, pending_requests = await asyncio.gather(
+        counter_store.get(db, [USERS_KEY, SESSIONS_KEY, ATTENDANCE_KEY]),
+        db.users.count_documents({"created_at": {"$gte": seven_days_ago}}),
+        db.sessions.count_documents({"created_at": {"$gte": seven_days_ago}}),
+        db.attendance_records.count_documents({"timestamp": {"$gte": seven_days_ago}}),
+        db.miss_requests.count_documents({"status": "pending"})
+    )
+
+    # Count users by role
+    by_role = counters.get(USERS_KEY, {})
+    total_users = sum(by_role.values())
+    trainee_count = by_role.get("trainee", 0)
+
+    # Count sessions
+    by_state = counters.get(SESSIONS_KEY, {})
+    total_sessions = by_state.get("active", 0) + by_state.get("inactive", 0)
+
+    # Calculate overall attendance rate
+    total_attendance_records = counters.get(ATTENDANCE_KEY, {}).get("attended", 0)
+    if total_sessions > 0 and total_users > 0:
+        expected_attendance = total_sessions * trainee_count
+        attendance_rate = (total_attendance_records / expected_attendance * 100) if expected_attendance > 0 else 0
+    else:
+        attendance_rate = 0
+
+    return {
+        "users": {
+            "total": total_users,
+            "admins": by_role.get("admin", 0),
+            "instructors": by_role.get("instructor", 0),
+            "trainees": trainee_count
+        },
+        "sessions": {
+            "total": total_sessions,
+            "active": by_state.get("active", 0),
+            "inactive": by_state.get("inactive", 0)
+        },
+        "attendance": {
+            "total_records": total_attendance_records,
+            "overall_rate": round(attendance_rate, 2)
+        },
+        "miss_requests": {
+            "pending": pending_requests
+        },
+        "recent_activity": {
+            "new_sessions": new_sessions,
+            "new_attendance": new_attendance,
+            "new_users": new_users
+        }
+    }
+
+
+class StatsSnapshotter:
+    """
+    Background task keeping a precomputed copy of the system stats
+
+    The snapshot lives in `stats_snapshots` so every worker serves the same
+    figures; a worker only recomputes once the stored snapshot is older
+    than the refresh interval.
+    """
+
+    def __init__(self, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self._task: Optional[asyncio.Task] = None
+
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refresh_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.refresh_seconds > 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh_if_stale()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                print(f"⚠️  Stats snapshot refresh failed: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    async def refresh_if_stale(self) -> bool:
+        db = get_database()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.refresh_seconds * 0.9)
+        if await db.stats_snapshots.find_one({"_id": SNAPSHOT_ID, "computed_at": {"$gte": cutoff}}, {"_id": 1}):
+            return False  # Another worker refreshed it
+        await self.refresh(db)
+        return True
+
+    async def refresh(self, db) -> dict:
+        started = time.perf_counter()
+        snapshot = {"stats": await compute_system_stats(db), "computed_at": datetime.utcnow()}
+        await db.stats_snapshots.replace_one({"_id": SNAPSHOT_ID}, snapshot, upsert=True)
+        self.refreshes += 1
+        self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 2)
+        return snapshot
+
+    async def get(self, db) -> Dict[str, Any]:
+        """Stats from the snapshot (computed now if there is none yet), with its age"""
+        snapshot = await db.stats_snapshots.find_one({"_id": SNAPSHOT_ID})
+        if not snapshot:
+            snapshot = await self.refresh(db)
+        return {
+            **snapshot["stats"],
+            "snapshot": {
+                "computed_at": snapshot["computed_at"],
+                "age_seconds": round((datetime.utcnow() - snapshot["computed_at"]).total_seconds(), 1)
+            }
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.running,
+            "refresh_seconds": self.refresh_seconds,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_refresh_ms": self.last_refresh_ms
+        }
+
+
+stats_snapshotter = StatsSnapshotter(refresh_seconds=settings.admin_stats_snapshot_seconds)